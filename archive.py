@@ -0,0 +1,252 @@
+"""
+归档模块 - 快报与审计数据的 SQLite 存档、历史查询
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from schemas import DataRecord, DerivedMetrics, BulletinOutput
+
+
+# 参考期 → 回溯天数（与 repo_adapter.fetch_ref_price 的口径一致）
+REF_OFFSET_DAYS = {"D-1": 1, "W-1": 7, "M-1": 30}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bulletins (
+    asof_date   TEXT NOT NULL,
+    commodity   TEXT NOT NULL,
+    scope       TEXT NOT NULL,
+    price_type  TEXT NOT NULL,
+    unit        TEXT NOT NULL,
+    price_cur   REAL NOT NULL,
+    refs        TEXT NOT NULL,
+    one_line    TEXT NOT NULL,
+    three_lines TEXT NOT NULL,
+    audit       TEXT NOT NULL,
+    metrics     TEXT NOT NULL,
+    created_at  TEXT NOT NULL,
+    PRIMARY KEY (asof_date, commodity, scope, price_type)
+);
+CREATE INDEX IF NOT EXISTS idx_bulletins_date_commodity ON bulletins (asof_date, commodity);
+CREATE INDEX IF NOT EXISTS idx_bulletins_commodity_date ON bulletins (commodity, asof_date);
+CREATE TABLE IF NOT EXISTS index_bases (
+    basket      TEXT NOT NULL,
+    member      TEXT NOT NULL,
+    base        REAL NOT NULL,
+    since       TEXT NOT NULL,
+    PRIMARY KEY (basket, member)
+);
+"""
+
+_COLUMNS = ("asof_date", "commodity", "scope", "price_type", "unit", "price_cur",
+            "refs", "one_line", "three_lines", "audit", "metrics", "created_at")
+
+
+def open_archive(path: str) -> sqlite3.Connection:
+    """打开（必要时创建）归档库"""
+    if path != ":memory:" and os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _to_row(rec: DataRecord, met: DerivedMetrics, out: BulletinOutput, created_at: str) -> Tuple:
+    return (
+        rec.asof_date,
+        rec.commodity,
+        rec.scope,
+        rec.price_type,
+        rec.unit,
+        rec.price_cur,
+        json.dumps(rec.refs, ensure_ascii=False),
+        out.one_line,
+        out.three_lines,
+        json.dumps(out.audit, ensure_ascii=False),
+        met.model_dump_json(),
+        created_at,
+    )
+
+
+def save_bulletins(conn: sqlite3.Connection,
+                   items: List[Tuple[DataRecord, DerivedMetrics, BulletinOutput]]) -> int:
+    """
+    批量写入本次运行的全部快报（单事务 executemany）
+
+    同一 (日期, 品类, 范围, 价格类型) 重复写入时覆盖旧记录。
+
+    Args:
+        conn: 归档库连接
+        items: (数据记录, 派生指标, 快报输出) 列表
+
+    Returns:
+        写入条数
+    """
+    if not items:
+        return 0
+
+    created_at = datetime.now().isoformat(timespec="seconds")
+    rows = [_to_row(rec, met, out, created_at) for rec, met, out in items]
+    placeholders = ", ".join("?" for _ in _COLUMNS)
+
+    with conn:  # 单事务：成功提交，异常回滚
+        conn.executemany(
+            f"INSERT OR REPLACE INTO bulletins ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+            rows
+        )
+    return len(rows)
+
+
+def _decode(row: sqlite3.Row) -> dict:
+    item = dict(row)
+    for key in ("refs", "audit", "metrics"):
+        item[key] = json.loads(item[key])
+    return item
+
+
+def query_history(conn: sqlite3.Connection, commodity: str,
+                  start: Optional[str] = None, end: Optional[str] = None,
+                  scope: Optional[str] = None, price_type: Optional[str] = None) -> List[dict]:
+    """
+    查询某品类在日期区间内的已发布快报（按日期升序）
+
+    Args:
+        conn: 归档库连接
+        commodity: 商品名称
+        start: 起始日期 "YYYY-MM-DD"（含），为空不限
+        end: 截止日期 "YYYY-MM-DD"（含），为空不限
+        scope: 市场范围过滤
+        price_type: 价格类型过滤
+
+    Returns:
+        记录字典列表，refs/audit/metrics 已解析为 dict
+    """
+    sql = "SELECT * FROM bulletins WHERE commodity = ?"
+    params: list = [commodity]
+    if start:
+        sql += " AND asof_date >= ?"
+        params.append(start)
+    if end:
+        sql += " AND asof_date <= ?"
+        params.append(end)
+    if scope:
+        sql += " AND scope = ?"
+        params.append(scope)
+    if price_type:
+        sql += " AND price_type = ?"
+        params.append(price_type)
+    sql += " ORDER BY asof_date"
+
+    return [_decode(row) for row in conn.execute(sql, params)]
+
+
+def ref_date_window(anchor_date: str, ref_code: str) -> Optional[Tuple[str, str]]:
+    """
+    参考期可接受的已发布日期区间 (起, 止)
+
+    止于参考日当天；参考日落在周末时向前顺延到最近的周五（周末无发布），
+    工作日则只认参考日当天——漏跑一天不会让 D-1 悄悄变成 D-2。
+    """
+    days = REF_OFFSET_DAYS.get(ref_code)
+    if days is None:
+        return None
+
+    ref_date = datetime.strptime(anchor_date, "%Y-%m-%d").date() - timedelta(days=days)
+    start = ref_date
+    while start.weekday() >= 5:
+        start -= timedelta(days=1)
+    return start.isoformat(), ref_date.isoformat()
+
+
+def fetch_archived_ref(conn: sqlite3.Connection, anchor_date: str, commodity: str,
+                       scope: str, price_type: str, unit: str, ref_code: str) -> Optional[float]:
+    """
+    从归档中取参考期（D-1/W-1/M-1）已发布价格
+
+    只取 ref_date_window 区间内最近一期的已发布价；区间内无存档或单位不一致时返回None，
+    由调用方回源查询。
+
+    Returns:
+        参考期价格，若无存档返回None
+    """
+    window = ref_date_window(anchor_date, ref_code)
+    if window is None:
+        return None
+
+    row = conn.execute(
+        "SELECT price_cur, unit FROM bulletins "
+        "WHERE commodity = ? AND scope = ? AND price_type = ? AND asof_date BETWEEN ? AND ? "
+        "ORDER BY asof_date DESC LIMIT 1",
+        (commodity, scope, price_type, *window)
+    ).fetchone()
+
+    if row is None or row["unit"] != unit:
+        return None
+    return float(row["price_cur"])
+
+
+def load_index_bases(conn: sqlite3.Connection) -> Dict[str, Dict[str, float]]:
+    """读取已固定的指数成分基期价 {指数: {成分: 基期价}}"""
+    bases: Dict[str, Dict[str, float]] = {}
+    for row in conn.execute("SELECT basket, member, base FROM index_bases"):
+        bases.setdefault(row["basket"], {})[row["member"]] = float(row["base"])
+    return bases
+
+
+def save_index_bases(conn: sqlite3.Connection, bases: Dict[str, Dict[str, float]], since: str) -> int:
+    """
+    固定指数成分基期价（已固定的不覆盖）
+
+    Args:
+        conn: 归档库连接
+        bases: {指数: {成分: 基期价}}
+        since: 基期日期 "YYYY-MM-DD"
+
+    Returns:
+        新固定的条数
+    """
+    rows = [(basket, member, base, since)
+            for basket, members in bases.items() for member, base in members.items()]
+    with conn:
+        cur = conn.executemany(
+            "INSERT OR IGNORE INTO index_bases (basket, member, base, since) VALUES (?, ?, ?, ?)",
+            rows
+        )
+    return cur.rowcount
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行查询：python archive.py 黑胡椒 --start 2025-03-01 --end 2025-03-31"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查询已归档的市场价格快报")
+    parser.add_argument("commodity", help="商品名称")
+    parser.add_argument("--db", default="out/bulletins.db", help="归档库路径")
+    parser.add_argument("--start", help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--end", help="截止日期 YYYY-MM-DD")
+    parser.add_argument("--scope", help="市场范围")
+    parser.add_argument("--format", choices=["one_line", "three_lines", "json"], default="one_line")
+    args = parser.parse_args(argv)
+
+    conn = open_archive(args.db)
+    try:
+        rows = query_history(conn, args.commodity, args.start, args.end, scope=args.scope)
+    finally:
+        conn.close()
+
+    if not rows:
+        print(f"未找到 {args.commodity} 的归档记录")
+        return
+
+    for row in rows:
+        if args.format == "json":
+            print(json.dumps(row, ensure_ascii=False))
+        else:
+            print(row[args.format])
+
+
+if __name__ == "__main__":
+    main()
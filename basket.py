@@ -0,0 +1,197 @@
+"""
+指数模块 - 加权品类/篮子指数（向量化聚合、成分变动时增量更新）
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from schemas import DataRecord
+
+
+INDEX_UNIT = "点"
+INDEX_BASE = 100.0
+
+
+class IndexBook:
+    """
+    多层加权篮子指数
+
+    每个篮子的成分可以是品类或其他篮子，当期指数 = 100 × Σ wᵢ·(pᵢ/baseᵢ) / Σ wᵢ，
+    当期缺失的成分不参与计算（权重自动重新归一）。各期依次为 periods（如 ["cur", "D-1", "W-1", "M-1"]）。
+
+    参考期点位按同口径比较：只用当期与该参考期都有价格的成分计算两期之比，
+    参考期点位 = 当期点位 ÷ 该比值。某成分仅缺参考价时不会把"成分变化"误报为涨跌。
+
+    品类基期价依次取配置 base、传入的已固定基期 bases；两者都没有时以首次载入的当期价
+    （当期缺失则取最近的有效一期）为基期，记入 new_bases 供调用方固定下来，
+    此后各次运行沿用同一基期，点位不随运行日漂移。子篮子以 100 为基期。
+
+    load() 每次整体向量化重算；update() 为单成分增量重算接口（常驻进程或盘中更正用，
+    main.run 每次运行走整体载入）。
+    """
+
+    def __init__(self, baskets: List[dict], periods: Sequence[str],
+                 bases: Dict[str, Dict[str, float]] = None):
+        self.periods = list(periods)
+        self._specs: Dict[str, dict] = {}
+        for b in baskets:
+            weights = b.get("weights") or {}
+            if not weights:
+                raise ValueError(f"指数 {b.get('name')} 未配置成分权重")
+            self._specs[b["name"]] = {
+                "members": list(weights),
+                "weights": np.array([float(w) for w in weights.values()]),
+                "base": {**((bases or {}).get(b["name"]) or {}), **(b.get("base") or {})},
+            }
+        self.new_bases: Dict[str, Dict[str, float]] = {}
+        self.order = self._topo_order()
+
+        # 成分 → [(所属篮子, 行号)]
+        self._parents: Dict[str, List[tuple]] = {}
+        for name in self.order:
+            for i, member in enumerate(self._specs[name]["members"]):
+                self._parents.setdefault(member, []).append((name, i))
+
+        # 各期按"当期与该期均有价格"的成分汇总：_cur[j]、_ref[j] 为两期加权相对价之和，_wsum[j] 为权重之和
+        n_periods = len(self.periods)
+        self._rel = {name: np.full((len(s["members"]), n_periods), np.nan)
+                     for name, s in self._specs.items()}
+        self._cur = {name: np.zeros(n_periods) for name in self._specs}
+        self._ref = {name: np.zeros(n_periods) for name in self._specs}
+        self._wsum = {name: np.zeros(n_periods) for name in self._specs}
+
+    def _topo_order(self) -> List[str]:
+        """按依赖排序（子篮子在前），存在循环引用时报错"""
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"指数循环引用: {' → '.join(path + [name])}")
+            state[name] = "visiting"
+            for member in self._specs[name]["members"]:
+                if member in self._specs:
+                    visit(member, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self._specs:
+            visit(name, [])
+        return order
+
+    @property
+    def commodities(self) -> List[str]:
+        """所有叶子成分（品类）"""
+        return [m for m in self._parents if m not in self._specs]
+
+    def _relatives(self, basket: str, row: int, values: np.ndarray) -> np.ndarray:
+        member = self._specs[basket]["members"][row]
+        if member in self._specs:
+            return values / INDEX_BASE
+
+        base = self._specs[basket]["base"]
+        if member not in base:
+            valid = values[~np.isnan(values)]
+            if not len(valid):
+                return values
+            base[member] = float(valid[0])
+            self.new_bases.setdefault(basket, {})[member] = base[member]
+        return values / float(base[member])
+
+    def load(self, prices: Dict[str, Sequence[Optional[float]]]) -> None:
+        """
+        整体载入全部成分价格并一次性计算各层指数
+
+        Args:
+            prices: {品类: [各期价格]}，顺序同 periods，缺失为None
+        """
+        for name in self.order:
+            spec = self._specs[name]
+            rel = self._rel[name]
+            for i, member in enumerate(spec["members"]):
+                if member in self._specs:
+                    values = self.levels(member)
+                else:
+                    values = _as_array(prices.get(member), len(self.periods))
+                rel[i] = self._relatives(name, i, values)
+            matched = _matched(rel)
+            self._cur[name] = spec["weights"] @ np.where(matched, rel[:, [0]], 0.0)
+            self._ref[name] = spec["weights"] @ np.where(matched, rel, 0.0)
+            self._wsum[name] = spec["weights"] @ matched
+
+    def update(self, member: str, values: Sequence[Optional[float]]) -> List[str]:
+        """
+        增量更新单个成分，只重算受影响的篮子
+
+        Args:
+            member: 品类名称
+            values: 新的各期价格，顺序同 periods
+
+        Returns:
+            受影响的指数名称（自下而上）
+        """
+        changed = []
+        pending = [(member, _as_array(values, len(self.periods)))]
+        while pending:
+            name, new_values = pending.pop(0)
+            for basket, row in self._parents.get(name, []):
+                w = self._specs[basket]["weights"][row]
+                old = self._rel[basket][row]
+                new = self._relatives(basket, row, new_values)
+                for rel, sign in ((old, -1.0), (new, 1.0)):
+                    matched = _matched(rel)
+                    self._cur[basket] += sign * w * np.where(matched, rel[0], 0.0)
+                    self._ref[basket] += sign * w * np.where(matched, rel, 0.0)
+                    self._wsum[basket] += sign * w * matched
+                self._rel[basket][row] = new
+                if basket not in changed:
+                    changed.append(basket)
+                pending.append((basket, self.levels(basket)))
+        return changed
+
+    def levels(self, name: str) -> np.ndarray:
+        """指数各期点位（无可比成分的期为 nan）"""
+        cur, ref, wsum = self._cur[name], self._ref[name], self._wsum[name]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            level = cur[0] / wsum[0] * INDEX_BASE if wsum[0] > 1e-12 else np.nan
+            return np.where((wsum > 1e-12) & (cur > 1e-12), level * ref / cur, np.nan)
+
+    def coverage(self, name: str) -> np.ndarray:
+        """各期参与计算的成分权重占比（参考期为当期与该期均有价格的成分）"""
+        return self._wsum[name] / self._specs[name]["weights"].sum()
+
+    def to_record(self, name: str, template: DataRecord) -> Optional[DataRecord]:
+        """
+        生成指数的合成数据记录（沿用模板的范围、价格类型、日期），当期无点位时返回None
+        """
+        levels = self.levels(name)
+        if np.isnan(levels[0]):
+            return None
+        refs = {code: (None if np.isnan(v) else round(float(v), 4))
+                for code, v in zip(self.periods[1:], levels[1:])}
+        return DataRecord(
+            commodity=name,
+            scope=template.scope,
+            price_type=template.price_type,
+            unit=INDEX_UNIT,
+            asof_date=template.asof_date,
+            price_cur=round(float(levels[0]), 4),
+            refs=refs,
+            source_name=f"{template.source_name}，加权测算",
+            source_url="",
+            notes="",
+            price_label="报"
+        )
+
+
+def _matched(rel: np.ndarray) -> np.ndarray:
+    """当期与各期均有值的掩码（rel 为单行或 成分×期 矩阵）"""
+    present = ~np.isnan(rel)
+    return present & present[..., :1]
+
+
+def _as_array(values: Optional[Sequence[Optional[float]]], n: int) -> np.ndarray:
+    if values is None:
+        return np.full(n, np.nan)
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
@@ -0,0 +1,439 @@
+"""
+压测工具 - 以本地替身数据源和推送端点跑完整 main.run 流程
+
+替身：SQLite 代替 PostgreSQL、本地 HTTP 价格服务（可配置延迟/故障率）、CSV 文件、
+带频率限制的企业微信机器人端点。报告端到端吞吐、分阶段耗时分位数与内存峰值。
+
+    python loadtest.py -n 200 --latency-ms 20 --wecom-window-sec 1 --max-fetch-p95-ms 1500 --min-throughput 8
+"""
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from archive import REF_OFFSET_DAYS
+from main import load_config, run
+from publisher import WECOM_MAX_BYTES
+from repo_adapter import fetch_price_from_csv, fetch_price_from_db, fetch_price_from_api
+from utils import StageTimer
+
+
+SOURCE_KINDS = ("db", "api", "csv")
+DB_SCOPE = "全国批发市场"        # fetch_price_from_db 参考实现固定查询的口径
+DB_PRICE_TYPE = "wholesale"
+FORMATS_CYCLE = ("one_line", "three_lines")
+
+
+def generate_histories(n_commodities: int, days: int, end_date: str,
+                       seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    生成合成价格历史（对数随机游走）
+
+    Returns:
+        {品类: {日期: 价格}}
+    """
+    rng = np.random.default_rng(seed)
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    dates = [(end - timedelta(days=i)).isoformat() for i in range(days - 1, -1, -1)]
+
+    start = rng.uniform(2.0, 120.0, n_commodities)
+    steps = rng.normal(0.0, 0.01, (n_commodities, days))
+    paths = np.round(start[:, None] * np.exp(np.cumsum(steps, axis=1)), 2)
+
+    return {f"品类{i + 1:04d}": dict(zip(dates, paths[i].tolist())) for i in range(n_commodities)}
+
+
+class _SqliteCursor:
+    """psycopg2 风格游标（%s 占位符）"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, sql: str, params=()):
+        self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+
+class _SqliteConnection:
+    """psycopg2 风格连接"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+
+    def cursor(self) -> _SqliteCursor:
+        return _SqliteCursor(self._conn.cursor())
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SqlitePriceDB:
+    """SQLite 版 market_prices 表，替代 fetch_price_from_db 的 PostgreSQL"""
+
+    def __init__(self, path: str, histories: Dict[str, Dict[str, float]]):
+        self.path = path
+        rows = [(d, c, DB_SCOPE, DB_PRICE_TYPE, p, d)
+                for c, series in histories.items() for d, p in series.items()]
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute("DROP TABLE IF EXISTS market_prices")
+            conn.execute("CREATE TABLE market_prices (date TEXT, commodity TEXT, scope TEXT, "
+                         "price_type TEXT, price REAL, updated_at TEXT)")
+            conn.execute("CREATE INDEX idx_market_prices ON market_prices (date, commodity)")
+            conn.executemany("INSERT INTO market_prices VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.close()
+
+    def connect(self, **kwargs) -> _SqliteConnection:
+        """兼容 psycopg2.connect 的调用方式（忽略连接参数）"""
+        return _SqliteConnection(self.path)
+
+
+class _LocalServer:
+    """后台线程中的本地 HTTP 服务"""
+
+    def __init__(self, handler):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PriceServer(_LocalServer):
+    """
+    本地价格 API（/price?date=&commodity=），与 fetch_price_from_api 对接
+
+    每次请求延迟 latency_ms + 指数分布抖动（均值 jitter_ms），按 failure_rate 返回 503。
+    """
+
+    def __init__(self, histories: Dict[str, Dict[str, float]], latency_ms: float = 20.0,
+                 jitter_ms: float = 10.0, failure_rate: float = 0.0, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        lock = threading.Lock()
+        self.requests = 0
+
+        def draw():
+            with lock:
+                self.requests += 1
+                return rng.exponential(jitter_ms) if jitter_ms > 0 else 0.0, rng.random()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                jitter, roll = draw()
+                time.sleep((latency_ms + jitter) / 1000.0)
+                query = parse_qs(urlparse(self.path).query)
+                if roll < failure_rate:
+                    return self._reply(503, {"error": "injected failure"})
+                price = histories.get(query["commodity"][0], {}).get(query["date"][0])
+                if price is None:
+                    return self._reply(404, {"error": "not found"})
+                self._reply(200, {"price": price})
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(Handler)
+
+
+class FakeWecom(_LocalServer):
+    """
+    企业微信机器人替身（/cgi-bin/webhook/send?key=）
+
+    按 key 限频（window_sec 内最多 rate_limit 条，超出返回 45009），
+    文本超过 max_bytes 字节返回 40058，与真实接口一致。
+    """
+
+    def __init__(self, rate_limit: int = 20, window_sec: float = 60.0,
+                 max_bytes: int = WECOM_MAX_BYTES):
+        self.rate_limit = rate_limit
+        self.window_sec = window_sec
+        lock = threading.Lock()
+        sent = defaultdict(deque)
+        self.counts = {"received": 0, "accepted": 0, "rate_limited": 0, "oversize": 0}
+        counts = self.counts
+
+        def admit(key: str, content: str) -> dict:
+            with lock:
+                counts["received"] += 1
+                if len(content.encode("utf-8")) > max_bytes:
+                    counts["oversize"] += 1
+                    return {"errcode": 40058, "errmsg": "content exceed max length"}
+                now = time.monotonic()
+                window = sent[key]
+                while window and now - window[0] >= window_sec:
+                    window.popleft()
+                if len(window) >= rate_limit:
+                    counts["rate_limited"] += 1
+                    return {"errcode": 45009, "errmsg": "api freq out of limit"}
+                window.append(now)
+                counts["accepted"] += 1
+                return {"errcode": 0, "errmsg": "ok"}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                key = parse_qs(urlparse(self.path).query).get("key", [""])[0]
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+                payload = json.dumps(admit(key, body["text"]["content"])).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(Handler)
+
+    def webhook(self, key: str) -> str:
+        return f"{self.base_url}/cgi-bin/webhook/send?key={key}"
+
+
+def build_sources(histories: Dict[str, Dict[str, float]], db: SqlitePriceDB,
+                  api_base: str, csv_path: str) -> dict:
+    """按品类轮流分配到 db/api/csv 三种参考适配器，返回 main.run 的 sources（熔断按适配器分组）"""
+    kinds = {c: SOURCE_KINDS[i % len(SOURCE_KINDS)] for i, c in enumerate(histories)}
+
+    def fetch_price(date_str, commodity, scope, price_type, unit, timeout=None):
+        kind = kinds.get(commodity)
+        if kind == "db":
+            return fetch_price_from_db(date_str, commodity, {"database": db.path},
+                                       timeout=timeout, raise_errors=True, connect=db.connect)
+        if kind == "api":
+            return fetch_price_from_api(date_str, commodity, {"base_url": api_base},
+                                        timeout=timeout, raise_errors=True)
+        return fetch_price_from_csv(date_str, commodity, csv_path)
+
+    def fetch_ref_price(anchor_date, commodity, scope, price_type, unit, ref_code, timeout=None):
+        days = REF_OFFSET_DAYS.get(ref_code)
+        if days is None:
+            return None
+        ref_date = (datetime.strptime(anchor_date, "%Y-%m-%d").date() - timedelta(days=days)).isoformat()
+        return fetch_price(ref_date, commodity, scope, price_type, unit, timeout=timeout)
+
+    return {"fetch_price": fetch_price, "fetch_ref_price": fetch_ref_price,
+            "source_of": kinds.get}
+
+
+def build_config(base_cfg: dict, commodities: List[str], run_date: str, workdir: str,
+                 wecom: FakeWecom, wecom_groups: int = 3, basket_size: int = 10) -> dict:
+    """在基础配置上替换品类、归档、指数与发布目标（企业微信目标按替身的限频节流）"""
+    cfg = copy.deepcopy(base_cfg)
+    cfg["run_date"] = run_date
+    cfg["scope"] = DB_SCOPE
+    cfg["price_type"] = DB_PRICE_TYPE
+    cfg["commodities"] = list(commodities)
+    cfg["normalize"] = {}
+    cfg["archive"] = {"enabled": True, "db_path": os.path.join(workdir, "bulletins.db"),
+                      "refs_from_archive": False}
+
+    groups = [commodities[i:i + basket_size] for i in range(0, len(commodities), basket_size)]
+    cfg["baskets"] = [{"name": f"分组指数{i + 1:03d}", "weights": {c: 1.0 for c in group}}
+                      for i, group in enumerate(groups)]
+    cfg["baskets"].append({"name": "综合指数", "weights": {b["name"]: 1.0 for b in cfg["baskets"]}})
+
+    targets = [
+        {"name": "文件-一句话", "type": "file", "format": "one_line",
+         "file_path": os.path.join(workdir, "bulletin_{{date}}.txt")},
+        {"name": "文件-三句话", "type": "file", "format": "three_lines",
+         "file_path": os.path.join(workdir, "bulletin_{{date}}_full.txt")},
+    ]
+    for i in range(wecom_groups):
+        targets.append({"name": f"群{i + 1}", "type": "wecom",
+                        "format": FORMATS_CYCLE[i % len(FORMATS_CYCLE)],
+                        "webhook": wecom.webhook(f"loadtest-{i + 1}"),
+                        "rate_limit": wecom.rate_limit, "rate_window_sec": wecom.window_sec})
+    cfg["publisher"] = {"timeout_sec": (base_cfg.get("publisher") or {}).get("timeout_sec", 10),
+                        "targets": targets}
+    return cfg
+
+
+def run_loadtest(n_commodities: int = 100, days: int = 45, runs: int = 1,
+                 run_date: str = "2025-08-21", latency_ms: float = 20.0, jitter_ms: float = 10.0,
+                 failure_rate: float = 0.0, wecom_groups: int = 3, wecom_rate_limit: int = 20,
+                 wecom_window_sec: float = 60.0,
+                 basket_size: int = 10, seed: int = 0, config_path: str = "app.cfg.yaml",
+                 workdir: Optional[str] = None) -> dict:
+    """
+    生成合成数据、启动替身服务并执行 runs 次完整 main.run
+
+    Returns:
+        压测报告，见 format_report
+    """
+    base_cfg = load_config(config_path)
+    histories = generate_histories(n_commodities, days, run_date, seed)
+    commodities = list(histories)
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as tmp:
+        workdir = workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+
+        csv_path = os.path.join(workdir, "prices.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("date,commodity,price\n")
+            for c, series in histories.items():
+                f.writelines(f"{d},{c},{p}\n" for d, p in series.items())
+        db = SqlitePriceDB(os.path.join(workdir, "market.db"), histories)
+
+        with PriceServer(histories, latency_ms, jitter_ms, failure_rate, seed) as prices, \
+                FakeWecom(rate_limit=wecom_rate_limit, window_sec=wecom_window_sec) as wecom:
+            cfg = build_config(base_cfg, commodities, run_date, workdir, wecom,
+                               wecom_groups, basket_size)
+            sources = build_sources(histories, db, prices.base_url, csv_path)
+            timer = StageTimer()
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            results = []
+            for _ in range(runs):
+                with timer.stage("total"):
+                    results.append(run(cfg=cfg, sources=sources, timer=timer, log_level="ERROR"))
+            wall = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            last = results[-1] or {}
+            return {
+                "commodities": n_commodities,
+                "runs": runs,
+                "wall_sec": wall,
+                "throughput_per_sec": n_commodities * runs / wall if wall > 0 else 0.0,
+                "bulletins": len(last.get("outputs", [])),
+                "stages": timer.percentiles(),
+                "peak_mem_mb": peak / 1024 / 1024,
+                "fetch_stats": last.get("fetch_stats", {}),
+                "price_api_requests": prices.requests,
+                "wecom": dict(wecom.counts),
+                "deliveries": [r.model_dump() for r in last.get("deliveries", [])],
+            }
+
+
+def format_report(report: dict) -> str:
+    """生成压测报告文本"""
+    lines = [
+        "=" * 60,
+        f"压测报告：{report['commodities']} 个品类 × {report['runs']} 次运行",
+        "=" * 60,
+        f"总耗时 {report['wall_sec']:.2f}s，吞吐 {report['throughput_per_sec']:.1f} 品类/秒，"
+        f"快报 {report['bulletins']} 条，内存峰值 {report['peak_mem_mb']:.1f} MB",
+        "",
+        f"{'阶段':<10}{'次数':>8}{'合计(s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}",
+    ]
+    for name, s in report["stages"].items():
+        lines.append(f"{name:<10}{s['count']:>8}{s['total']:>10.2f}"
+                     f"{s['p50'] * 1000:>10.1f}{s['p95'] * 1000:>10.1f}{s['p99'] * 1000:>10.1f}")
+    lines += [
+        "",
+        f"取数统计: {report['fetch_stats']}",
+        f"价格API请求: {report['price_api_requests']}",
+        f"企业微信替身: {report['wecom']}",
+        "投递结果:",
+    ]
+    for d in report["deliveries"]:
+        lines.append(f"  {d['name']} [{d['type']}/{d['format']}] {d['status']} "
+                     f"{d['elapsed_sec']:.2f}s{' - ' + d['error'] if d['error'] else ''}")
+    return "\n".join(lines)
+
+
+def check_gates(report: dict, max_fetch_p95_ms: Optional[float] = None,
+                min_throughput: Optional[float] = None, max_peak_mb: Optional[float] = None,
+                require_delivery: bool = True) -> List[str]:
+    """
+    回归门禁检查
+
+    Returns:
+        未通过的门禁说明，全部通过时为空列表
+    """
+    failures = []
+    fetch = report["stages"].get("fetch")
+    if max_fetch_p95_ms is not None and fetch and fetch["p95"] * 1000 > max_fetch_p95_ms:
+        failures.append(f"取数 p95 {fetch['p95'] * 1000:.1f}ms > {max_fetch_p95_ms:g}ms")
+    if min_throughput is not None and report["throughput_per_sec"] < min_throughput:
+        failures.append(f"吞吐 {report['throughput_per_sec']:.1f}/s < {min_throughput:g}/s")
+    if max_peak_mb is not None and report["peak_mem_mb"] > max_peak_mb:
+        failures.append(f"内存峰值 {report['peak_mem_mb']:.1f}MB > {max_peak_mb:g}MB")
+    if require_delivery:
+        partial = [d["name"] for d in report["deliveries"] if d["status"] == "partial"]
+        failed = [d["name"] for d in report["deliveries"] if d["status"] not in ("ok", "partial")]
+        if partial:
+            failures.append(f"部分投递: {', '.join(partial)}")
+        if failed or not report["deliveries"]:
+            failures.append(f"投递失败: {', '.join(failed) or '无投递结果'}")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="市场价格快报端到端压测")
+    parser.add_argument("-n", "--commodities", type=int, default=100, help="品类数")
+    parser.add_argument("--days", type=int, default=45, help="合成历史天数（需覆盖 M-1）")
+    parser.add_argument("--runs", type=int, default=1, help="重复运行次数")
+    parser.add_argument("--run-date", default="2025-08-21")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="价格API基础延迟")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="价格API延迟抖动均值")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="价格API故障注入比例")
+    parser.add_argument("--wecom-groups", type=int, default=3, help="企业微信群数量")
+    parser.add_argument("--wecom-rate-limit", type=int, default=20, help="每群每个限频窗口的消息上限")
+    parser.add_argument("--wecom-window-sec", type=float, default=60.0,
+                        help="企业微信限频窗口（秒），压测时可缩短以验证节流而不拖长运行")
+    parser.add_argument("--basket-size", type=int, default=10, help="每个分组指数的成分数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default="app.cfg.yaml", help="基础配置文件")
+    parser.add_argument("--max-fetch-p95-ms", type=float, help="门禁：单品类取数 p95 上限")
+    parser.add_argument("--min-throughput", type=float, help="门禁：吞吐下限（品类/秒）")
+    parser.add_argument("--max-peak-mb", type=float, help="门禁：内存峰值上限")
+    parser.add_argument("--allow-delivery-failures", action="store_true", help="不把投递失败计入门禁")
+    parser.add_argument("--json", action="store_true", help="以JSON输出报告")
+    args = parser.parse_args(argv)
+
+    report = run_loadtest(
+        n_commodities=args.commodities, days=args.days, runs=args.runs, run_date=args.run_date,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate,
+        wecom_groups=args.wecom_groups, wecom_rate_limit=args.wecom_rate_limit,
+        wecom_window_sec=args.wecom_window_sec,
+        basket_size=args.basket_size, seed=args.seed, config_path=args.config,
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else format_report(report))
+
+    failures = check_gates(report, args.max_fetch_p95_ms, args.min_throughput, args.max_peak_mb,
+                           require_delivery=not args.allow_delivery_failures)
+    for f in failures:
+        print(f"❌ 门禁未通过: {f}")
+    if not failures:
+        print("✅ 门禁通过")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,14 +3,22 @@
 """
 import yaml
 from datetime import date
-from typing import List
+from concurrent.futures import wait
+from typing import Dict, List, Optional
+
+import numpy as np
 
 from schemas import DataRecord
 from repo_adapter import fetch_price, fetch_ref_price
 from derive import derive_metrics
 from render import render_output
-from publisher import publish_stdout, publish_file, publish_wecom
-from utils import setup_logger, parse_date, validate_config
+from publisher import resolve_targets, publish_targets, format_delivery_summary
+from utils import setup_logger, parse_date, validate_config, StageTimer, DaemonPool
+from archive import (open_archive, save_bulletins, fetch_archived_ref, ref_date_window,
+                     load_index_bases, save_index_bases)
+from resilience import GuardedFetcher
+from normalize import UnitNormalizer
+from basket import IndexBook
 
 
 def load_config(config_path: str = "app.cfg.yaml") -> dict:
@@ -26,52 +34,261 @@ def load_config(config_path: str = "app.cfg.yaml") -> dict:
         raise
 
 
-def process_commodity(commodity: str, run_date: str, cfg: dict, logger) -> DataRecord:
-    """处理单个商品的价格数据"""
+def source_key(commodity: str, cfg: dict, sources: dict = None) -> str:
+    """
+    品类的上游数据源标识（熔断与延迟统计按此分组）
+
+    优先用 sources["source_of"](commodity)，其次 fetch.sources 配置，缺省为 fetch.default_source。
+    """
+    if sources and "source_of" in sources:
+        return sources["source_of"](commodity)
+    fetch_cfg = cfg.get("fetch") or {}
+    return (fetch_cfg.get("sources") or {}).get(commodity, fetch_cfg.get("default_source", "default"))
+
+
+def _fetch(fetcher, source: str, fn, *args):
+    """经 GuardedFetcher 调用适配函数；未配置时直接调用"""
+    if fetcher is None:
+        return fn(*args)
+    return fetcher.call(source, fn, *args)
+
+
+def archived_refs(archive_conn, run_date: str, commodity: str, cfg: dict) -> Dict[str, float]:
+    """查询品类各参考期的已发布存档价（已是 unit），无存档的参考期不出现在结果中"""
+    found = {}
+    for ref_code in cfg["references"]:
+        ref_price = fetch_archived_ref(archive_conn, run_date, commodity, cfg["scope"],
+                                       cfg["price_type"], cfg["unit"], ref_code)
+        if ref_price is not None:
+            found[ref_code] = ref_price
+    return found
+
+
+def fetch_commodity(commodity: str, run_date: str, cfg: dict, logger,
+                    archive_conn=None, fetcher=None, src_unit: str = None,
+                    sources: dict = None, archived: Dict[str, float] = None) -> Optional[dict]:
+    """
+    取单个品类的当日价与参考价（不做单位换算）
+
+    传入 archive_conn（或已查好的 archived）时参考期优先取已发布存档（已是 unit）；
+    传入 fetcher 时取数受运行截止预算约束，超时或熔断的参考期按缺失处理。sources 可替换适配函数（键 fetch_price / fetch_ref_price），
+    并可用 source_of 声明品类的上游来源，默认使用 repo_adapter 与 fetch.sources 配置。
+
+    Returns:
+        {"commodity", "source_unit", "fetched": {"cur"/参考期: 原始单位价格}, "archived": {参考期: 已发布价}}，
+        无当日价时返回None
+    """
     logger.info(f"处理商品: {commodity}")
+    sources = sources or {}
+    price_fn = sources.get("fetch_price", fetch_price)
+    ref_fn = sources.get("fetch_ref_price", fetch_ref_price)
+    source = source_key(commodity, cfg, sources)
+    src_unit = src_unit or cfg["unit"]
     
     # 获取当日价格
-    price_cur = fetch_price(run_date, commodity, cfg["scope"], cfg["price_type"], cfg["unit"])
+    price_cur = _fetch(fetcher, source, price_fn, run_date, commodity, cfg["scope"],
+                       cfg["price_type"], src_unit)
     
     if price_cur is None:
         logger.warning(f"未找到 {commodity} 在 {run_date} 的价格数据")
         return None
     
-    # 获取参考期价格
-    refs = {}
+    # 获取参考期价格（存档值已是 unit，数据源值为原始单位）
+    if archived is None:
+        archived = archived_refs(archive_conn, run_date, commodity, cfg) if archive_conn is not None else {}
+    fetched = {"cur": price_cur}
     for ref_code in cfg["references"]:
-        ref_price = fetch_ref_price(run_date, commodity, cfg["scope"], 
-                                  cfg["price_type"], cfg["unit"], ref_code)
-        refs[ref_code] = ref_price
+        if ref_code in archived:
+            continue
+        ref_price = _fetch(fetcher, source, ref_fn, run_date, commodity, cfg["scope"],
+                           cfg["price_type"], src_unit, ref_code)
+        fetched[ref_code] = ref_price
         if ref_price is None:
             logger.warning(f"{commodity} 缺少 {ref_code} 参考价格")
     
-    # 构建数据记录
-    rec = DataRecord(
-        commodity=commodity,
-        scope=cfg["scope"],
-        price_type=cfg["price_type"],
-        unit=cfg["unit"],
-        asof_date=run_date,
-        price_cur=price_cur,
-        refs=refs,
-        source_name="农业农村部监测",  # 可配置化
-        source_url="",
-        notes=""
-    )
+    return {"commodity": commodity, "source_unit": src_unit,
+            "fetched": fetched, "archived": archived}
+
+
+def fetch_all(cfg: dict, run_date: str, logger, fetcher, normalizer,
+              archive_conn=None, sources: dict = None, timer: StageTimer = None) -> List[dict]:
+    """
+    并发取数全部品类（共享运行截止预算），结果按 commodities 顺序返回
+
+    各品类在守护线程中并发取数（fetch.concurrency，默认 8），慢数据源只占用自身的调用，
+    不再让健康数据源的品类排队等待；存档参考价在调用线程中预先查询（SQLite 连接不跨线程）。
+    """
+    commodities = list(cfg["commodities"])
+    timer = timer or StageTimer()
+    archived = {c: archived_refs(archive_conn, run_date, c, cfg) for c in commodities} \
+        if archive_conn is not None else {}
+
+    def task(commodity):
+        with timer.stage("fetch"):
+            return fetch_commodity(commodity, run_date, cfg, logger, fetcher=fetcher,
+                                   src_unit=normalizer.source_unit(commodity), sources=sources,
+                                   archived=archived.get(commodity, {}))
+
+    pool = DaemonPool(max_workers=int((cfg.get("fetch") or {}).get("concurrency", 8)),
+                      thread_name_prefix="commodity")
+    try:
+        futures = [pool.submit(task, c) for c in commodities]
+        # 各调用已受预算约束，整体再留一次调用上限的余量
+        done, _ = wait(futures, timeout=fetcher.deadline.remaining() + fetcher.call_timeout_sec)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    quotes = []
+    for commodity, fut in zip(commodities, futures):
+        if fut not in done:
+            logger.error(f"处理 {commodity} 超出取数预算，跳过")
+        elif fut.exception() is not None:
+            logger.error(f"处理 {commodity} 时出错: {fut.exception()}")
+        elif fut.result() is not None:
+            quotes.append(fut.result())
+    return quotes
+
+
+def build_records(quotes: List[dict], run_date: str, cfg: dict, logger,
+                  normalizer=None) -> List[DataRecord]:
+    """
+    整批单位归一并构建数据记录
+
+    本次回源的价格组成 品类×期 矩阵一次换算；各期按自身日期的汇率折算（参考期取参考日），
+    与存档中参考日已发布的价格口径一致，存档参考价不再换算。
+    """
+    if not quotes:
+        return []
+
+    periods = ["cur"] + list(cfg["references"])
+    dates = [run_date] + [(ref_date_window(run_date, code) or (None, run_date))[1]
+                          for code in cfg["references"]]
+    raw = np.array([[np.nan if q["fetched"].get(p) is None else q["fetched"][p] for p in periods]
+                    for q in quotes], dtype=float)
+    units = [q["source_unit"] for q in quotes]
+
+    if normalizer is not None:
+        converted, factors = normalizer.convert_matrix(raw, units, dates)
+    else:
+        converted, factors = raw, np.ones_like(raw)
+
+    records = []
+    for i, q in enumerate(quotes):
+        commodity = q["commodity"]
+        if np.isnan(converted[i, 0]):
+            logger.error(f"{commodity} 当日价无法从 {units[i]} 换算到 {cfg['unit']}（单位无法识别或缺少汇率）")
+            continue
+        
+        # 参考期换算系数：存档值已是 unit，记为 None（未换算）
+        refs, ref_factors = {}, {}
+        for j, code in enumerate(periods[1:], start=1):
+            if code in q["archived"]:
+                refs[code] = q["archived"][code]
+                ref_factors[code] = None
+            elif np.isnan(converted[i, j]):
+                if q["fetched"].get(code) is not None:
+                    logger.warning(f"{commodity} {code} 参考价缺少 {dates[j]} 汇率，按缺失处理")
+                refs[code] = None
+            else:
+                refs[code] = float(converted[i, j])
+                ref_factors[code] = float(factors[i, j])
+        
+        # 构建数据记录
+        records.append(DataRecord(
+            commodity=commodity,
+            scope=cfg["scope"],
+            price_type=cfg["price_type"],
+            unit=cfg["unit"],
+            asof_date=run_date,
+            price_cur=float(converted[i, 0]),
+            refs=refs,
+            source_name="农业农村部监测",  # 可配置化
+            source_url="",
+            notes="",
+            source_unit=units[i],
+            unit_factor=float(factors[i, 0]),
+            ref_factors=ref_factors
+        ))
     
-    return rec
+    return records
+
+
+def process_commodity(commodity: str, run_date: str, cfg: dict, logger,
+                      archive_conn=None, fetcher=None, normalizer=None,
+                      sources: dict = None) -> DataRecord:
+    """处理单个商品的价格数据（取数 + 单位归一）；整批运行见 fetch_commodity / build_records"""
+    src_unit = normalizer.source_unit(commodity) if normalizer else cfg["unit"]
+    quote = fetch_commodity(commodity, run_date, cfg, logger, archive_conn=archive_conn,
+                            fetcher=fetcher, src_unit=src_unit, sources=sources)
+    if quote is None:
+        return None
+    records = build_records([quote], run_date, cfg, logger, normalizer)
+    return records[0] if records else None
+
+
+def build_index_records(cfg: dict, records: List[DataRecord], logger,
+                        archive_conn=None) -> List[DataRecord]:
+    """
+    由本次已取得的品类记录计算加权指数，生成合成数据记录（不重新取数）
+
+    成分基期价取配置 base 或归档中已固定的基期；首次出现的成分以当期价为基期并写入归档，
+    之后各次运行沿用。未启用归档时，各品类成分须在配置中给出 base。
+    """
+    baskets = cfg.get("baskets") or []
+    if not baskets or not records:
+        return []
+
+    bases = load_index_bases(archive_conn) if archive_conn is not None else {}
+    book = IndexBook(baskets, ["cur"] + list(cfg["references"]), bases=bases)
+    book.load({rec.commodity: [rec.price_cur] + [rec.refs.get(c) for c in cfg["references"]]
+               for rec in records})
+
+    if book.new_bases:
+        missing = [f"{b}/{m}" for b, members in book.new_bases.items() for m in members]
+        if archive_conn is None:
+            raise ValueError(f"未启用归档，指数基期无法固定，请在 baskets.base 中配置: {', '.join(missing)}")
+        save_index_bases(archive_conn, book.new_bases, records[0].asof_date)
+        logger.info(f"固定指数基期: {', '.join(missing)}")
+
+    index_records = []
+    for name in book.order:
+        coverage = book.coverage(name)
+        partial = [f"{period} {c:.0%}" for period, c in zip(book.periods, coverage) if c < 1.0 - 1e-9]
+        if partial:
+            logger.warning(f"{name} 成分不全（权重覆盖：{', '.join(partial)}），参考期按同口径成分比较")
+        rec = book.to_record(name, records[0])
+        if rec is None:
+            logger.warning(f"{name} 无可用成分价格，跳过")
+            continue
+        index_records.append(rec)
+    return index_records
 
 
-def run():
-    """主运行函数"""
+def run(config_path: str = "app.cfg.yaml", cfg: dict = None, sources: dict = None,
+        timer: StageTimer = None, log_level: str = "INFO") -> dict:
+    """
+    主运行函数
+
+    Args:
+        config_path: 配置文件路径（传入 cfg 时忽略）
+        cfg: 已加载的配置
+        sources: 替换的适配函数，见 process_commodity
+        timer: 分阶段耗时记录器
+        log_level: 日志级别
+
+    Returns:
+        运行结果 {"run_date", "outputs", "deliveries", "fetch_stats"}；未生成快报时返回None
+    """
     # 设置日志
-    logger = setup_logger()
+    logger = setup_logger(level=log_level)
     logger.info("启动市场价格快报生成器")
+    timer = timer or StageTimer()
+    archive_conn = None
+    fetcher = None
     
     try:
         # 加载配置
-        cfg = load_config()
+        cfg = cfg or load_config(config_path)
         if not validate_config(cfg):
             return
         
@@ -84,60 +301,92 @@ def run():
         run_date = run_date_obj.isoformat()
         logger.info(f"生成日期: {run_date}")
         
-        # 处理所有商品
+        # 打开归档库
+        archive_cfg = cfg.get("archive") or {}
+        if archive_cfg.get("enabled"):
+            archive_conn = open_archive(archive_cfg.get("db_path", "out/bulletins.db"))
+        ref_conn = archive_conn if archive_cfg.get("refs_from_archive") else None
+        
+        # 取数截止预算、对冲与熔断
+        fetcher = GuardedFetcher.from_config(cfg.get("fetch") or {}, logger)
+        logger.info(f"取数预算: {fetcher.deadline.remaining():.0f}s")
+        
+        # 单位与币种归一
+        normalizer = UnitNormalizer.from_config(cfg, run_date, logger)
+        
+        # 并发取数（原始单位）
+        quotes = fetch_all(cfg, run_date, logger, fetcher, normalizer,
+                           archive_conn=ref_conn, sources=sources, timer=timer)
+        
+        # 整批单位归一并构建各品类数据记录
+        with timer.stage("normalize"):
+            records = build_records(quotes, run_date, cfg, logger, normalizer)
+        
+        # 加权指数（合成记录，与品类走同一计算/渲染流程）
+        try:
+            with timer.stage("index"):
+                records += build_index_records(cfg, records, logger, archive_conn)
+        except Exception as e:
+            logger.error(f"计算加权指数时出错: {e}")
+        
+        # 计算指标并渲染
         outputs = []
-        for commodity in cfg["commodities"]:
+        archived = []
+        for rec in records:
             try:
-                rec = process_commodity(commodity, run_date, cfg, logger)
-                if rec is None:
-                    continue
-                
                 # 计算派生指标
-                met = derive_metrics(rec, cfg["rules"])
+                with timer.stage("derive"):
+                    met = derive_metrics(rec, cfg["rules"])
                 
                 # 异常检查
                 if met.anomaly:
-                    logger.warning(f"{commodity} 价格异常波动，建议人工审核")
+                    logger.warning(f"{rec.commodity} 价格异常波动，建议人工审核")
                 
                 # 渲染输出
-                out = render_output(rec, met, cfg["style"], cfg["rules"])
+                with timer.stage("render"):
+                    out = render_output(rec, met, cfg["style"], cfg["rules"])
                 outputs.append(out)
+                archived.append((rec, met, out))
                 
-                logger.info(f"✅ {commodity} 快报生成完成")
+                logger.info(f"✅ {rec.commodity} 快报生成完成")
                 
             except Exception as e:
-                logger.error(f"处理 {commodity} 时出错: {e}")
+                logger.error(f"处理 {rec.commodity} 时出错: {e}")
                 continue
         
+        logger.info(f"取数统计: {fetcher.stats}")
+        
         if not outputs:
             logger.warning("没有生成任何快报")
             return
         
-        # 发布快报
-        texts = [o.one_line for o in outputs]  # 默认使用一句话版本
-        
-        publisher_cfg = cfg["publisher"]
-        mode = publisher_cfg["mode"]
-        
-        if mode == "stdout":
-            publish_stdout(texts)
-        elif mode == "file":
-            path = publisher_cfg["file_path"].replace("{{date}}", run_date)
-            publish_file(path, texts)
-        elif mode == "wecom":
-            webhook = publisher_cfg.get("wecom_webhook")
-            if webhook:
-                publish_wecom(webhook, texts)
-            else:
-                logger.error("企业微信webhook未配置")
-        else:
-            logger.error(f"不支持的发布模式: {mode}")
+        # 归档（单事务批量写入）
+        if archive_conn is not None:
+            with timer.stage("archive"):
+                n = save_bulletins(archive_conn, archived)
+            logger.info(f"已归档 {n} 条快报")
+        
+        # 发布快报（单次计算，多目标并发投递）
+        targets = resolve_targets(cfg["publisher"])
+        with timer.stage("publish"):
+            results = publish_targets(targets, outputs, run_date)
+        logger.info(format_delivery_summary(results))
+        for r in results:
+            if r.status != "ok":
+                logger.error(f"发布目标 {r.name} 投递失败: {r.error}")
         
         logger.info(f"✅ 快报生成完成，共 {len(outputs)} 条")
+        return {"run_date": run_date, "outputs": outputs,
+                "deliveries": results, "fetch_stats": dict(fetcher.stats)}
         
     except Exception as e:
         logger.error(f"运行失败: {e}")
         raise
+    finally:
+        if fetcher is not None:
+            fetcher.close()
+        if archive_conn is not None:
+            archive_conn.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+"""
+单位归一模块 - 计价单位与币种换算（品类×期 价格矩阵整批换算，单次运行内缓存换算系数）
+
+汇率口径：每个价格按其自身日期的汇率折算——当日价用运行日汇率，参考价用参考日汇率，
+与存档中参考日当天已发布的价格口径一致；参考日无汇率文件时向前顺延至多 fx_carry_days 天，
+仍缺失则该价格按缺失处理。
+"""
+import csv
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# 计量单位 → 公斤
+MASS_UNITS_KG = {
+    "克": 0.001,
+    "g": 0.001,
+    "斤": 0.5,
+    "公斤": 1.0,
+    "千克": 1.0,
+    "kg": 1.0,
+    "吨": 1000.0,
+    "t": 1000.0,
+    "ton": 1000.0,
+}
+
+# 币种别名 → ISO 代码
+CURRENCY_ALIASES = {
+    "元": "CNY",
+    "人民币": "CNY",
+    "RMB": "CNY",
+    "CNY": "CNY",
+    "美元": "USD",
+    "USD": "USD",
+}
+
+
+def parse_unit(unit: str, mass_units: Dict[str, float] = None,
+               currency_aliases: Dict[str, str] = None) -> Tuple[str, float]:
+    """
+    解析计价单位，如 "元/公斤" → ("CNY", 1.0)，"USD/吨" → ("USD", 1000.0)
+
+    Returns:
+        (币种代码, 每计量单位对应的公斤数)
+    """
+    mass_units = mass_units or MASS_UNITS_KG
+    currency_aliases = currency_aliases or CURRENCY_ALIASES
+
+    if "/" not in unit:
+        raise ValueError(f"无法识别的计价单位: {unit}")
+    cur, mass = (x.strip() for x in unit.split("/", 1))
+
+    currency = currency_aliases.get(cur, currency_aliases.get(cur.upper()))
+    kg = mass_units.get(mass, mass_units.get(mass.lower()))
+    if currency is None or kg is None:
+        raise ValueError(f"无法识别的计价单位: {unit}")
+    return currency, kg
+
+
+def load_fx(path: str) -> Dict[str, float]:
+    """
+    读取每日汇率文件（CSV，列：currency,rate；rate 为 1 单位外币折合人民币）
+
+    Returns:
+        {币种代码: 人民币汇率}，始终包含 CNY=1.0
+    """
+    rates = {"CNY": 1.0}
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            rates[row["currency"].strip().upper()] = float(row["rate"])
+    return rates
+
+
+def load_fx_for_date(fx_file: str, date_str: str, carry_days: int = 3) -> Optional[Dict[str, float]]:
+    """
+    读取某日汇率（fx_file 中 {{date}} 替换为日期），当日缺失时向前顺延至多 carry_days 天
+
+    Returns:
+        汇率字典，找不到时返回None
+    """
+    day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    for back in range(carry_days + 1):
+        path = fx_file.replace("{{date}}", (day - timedelta(days=back)).isoformat())
+        if os.path.exists(path):
+            return load_fx(path)
+    return None
+
+
+class UnitNormalizer:
+    """将数据源原始单位的价格换算到目标单位"""
+
+    def __init__(self, target_unit: str, fx: Dict[str, float] = None,
+                 source_units: Dict[str, str] = None,
+                 mass_units: Dict[str, float] = None,
+                 fx_loader: Callable[[str], Optional[Dict[str, float]]] = None):
+        self.target_unit = target_unit
+        self.fx = {"CNY": 1.0, **(fx or {})}
+        self.source_units = source_units or {}
+        self.mass_units = {**MASS_UNITS_KG, **(mass_units or {})}
+        self._target: Optional[Tuple[str, float]] = None   # 首次需要换算时解析
+        self._fx_loader = fx_loader
+        self._fx_by_date: Dict[str, Optional[Dict[str, float]]] = {}
+        self._factors: Dict[Tuple[str, Optional[str]], float] = {}
+
+    @classmethod
+    def from_config(cls, cfg: dict, run_date: str, logger=None) -> "UnitNormalizer":
+        """
+        由配置构建：目标单位取 cfg["unit"]，汇率文件取 normalize.fx_file（{{date}} 替换为价格日期）
+        """
+        norm_cfg = cfg.get("normalize") or {}
+        fx, fx_loader = {}, None
+        fx_file = norm_cfg.get("fx_file")
+        if fx_file:
+            carry_days = int(norm_cfg.get("fx_carry_days", 3))
+            fx_loader = lambda d: load_fx_for_date(fx_file, d, carry_days)  # noqa: E731
+            fx = fx_loader(run_date)
+            if fx is None:
+                fx = {}
+                if logger:
+                    logger.warning(f"汇率文件不存在: {fx_file.replace('{{date}}', run_date)}，"
+                                   f"当日仅支持人民币计价换算")
+        return cls(cfg["unit"], fx=fx,
+                   source_units=norm_cfg.get("source_units"),
+                   mass_units=norm_cfg.get("mass_units"),
+                   fx_loader=fx_loader)
+
+    def source_unit(self, commodity: str) -> str:
+        """品类的数据源原始单位（未配置时视为已是目标单位）"""
+        return self.source_units.get(commodity, self.target_unit)
+
+    def _fx_on(self, date_str: Optional[str]) -> Optional[Dict[str, float]]:
+        if date_str is None or self._fx_loader is None:
+            return self.fx
+        if date_str not in self._fx_by_date:
+            rates = self._fx_loader(date_str)
+            self._fx_by_date[date_str] = None if rates is None else {"CNY": 1.0, **rates}
+        return self._fx_by_date[date_str]
+
+    def factor(self, src_unit: str, date_str: Optional[str] = None) -> float:
+        """
+        原始单位 → 目标单位的换算系数（单次运行内缓存）
+
+        原始单位与目标单位相同时直接为 1.0，不解析单位（允许"元/只"等计量单位表外的单位）。
+
+        Args:
+            src_unit: 原始单位
+            date_str: 价格日期，跨币种时取该日汇率；为空时用运行日汇率
+        """
+        if src_unit == self.target_unit:
+            return 1.0
+        src_cur, src_kg = parse_unit(src_unit, self.mass_units)
+        if self._target is None:
+            self._target = parse_unit(self.target_unit, self.mass_units)
+        tgt_cur, tgt_kg = self._target
+        key = (src_unit, date_str if src_cur != tgt_cur else None)
+
+        if key not in self._factors:
+            rate = 1.0
+            if src_cur != tgt_cur:
+                fx = self._fx_on(date_str)
+                for code in (src_cur, tgt_cur):
+                    if fx is None or code not in fx:
+                        raise ValueError(f"缺少 {date_str or '当日'} {code} 汇率，"
+                                         f"无法换算 {src_unit} → {self.target_unit}")
+                rate = fx[src_cur] / fx[tgt_cur]
+            self._factors[key] = rate * (tgt_kg / src_kg)
+        return self._factors[key]
+
+    def convert_matrix(self, values, src_units: Sequence[str],
+                       dates: Sequence[Optional[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        整批换算 品类×期 价格矩阵
+
+        Args:
+            values: n×p 价格矩阵（原始单位，nan 为缺失）
+            src_units: 各行原始单位
+            dates: 各列价格日期（决定汇率），为空时全部用运行日汇率
+
+        Returns:
+            (目标单位价格矩阵, 换算系数矩阵)，无法换算处为 nan
+        """
+        if not len(src_units):
+            empty = np.empty((0, len(dates) if dates is not None else 0))
+            return empty, empty
+        values = np.asarray(values, dtype=float).reshape(len(src_units), -1)
+        dates = list(dates) if dates is not None else [None] * values.shape[1]
+
+        units = sorted(set(src_units))
+        table = np.full((len(units), len(dates)), np.nan)
+        for u, unit in enumerate(units):
+            for j, date_str in enumerate(dates):
+                try:
+                    table[u, j] = self.factor(unit, date_str)
+                except ValueError:
+                    pass
+
+        row_of = {unit: u for u, unit in enumerate(units)}
+        factors = table[[row_of[unit] for unit in src_units]]
+        return np.round(values * factors, 4), factors
+
+    def convert(self, values: Sequence[Optional[float]], src_unit: str) -> List[Optional[float]]:
+        """
+        按运行日汇率换算一组价格，None 保持为 None
+
+        Args:
+            values: 原始单位下的价格序列
+            src_unit: 原始单位
+
+        Returns:
+            目标单位下的价格列表
+        """
+        arr = np.array([[np.nan if v is None else v for v in values]], dtype=float)
+        converted, _ = self.convert_matrix(arr, [src_unit])
+        return [None if np.isnan(v) else float(v) for v in converted[0]]
@@ -1,71 +1,337 @@
 """
-推送模块 - 支持终端输出、文件保存、企业微信机器人
+推送模块 - 支持终端输出、文件保存、企业微信机器人，多目标并发投递
 """
 import json
 import requests
 import os
-from typing import List
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+from schemas import BulletinOutput, DeliveryResult
+from utils import DaemonPool
+
+
+DEFAULT_TIMEOUT_SEC = 10
+FORMATS = ("one_line", "three_lines")
+WECOM_MAX_BYTES = 2048                 # 企业微信文本消息上限（UTF-8 字节）
+WECOM_RATE_LIMIT = 20                  # 企业微信机器人限频：每个 webhook 每窗口最多条数
+WECOM_RATE_WINDOW_SEC = 60.0
+
+# webhook → 近期发送时刻（单调时钟），进程内各目标、各次运行共享
+_wecom_sent: Dict[str, deque] = defaultdict(deque)
+_wecom_lock = threading.Lock()
+
+
+class PartialDelivery(RuntimeError):
+    """已发送部分消息后失败"""
+
+    def __init__(self, sent: int, total: int, reason: str):
+        super().__init__(f"已发送 {sent}/{total} 条后失败: {reason}")
+        self.sent = sent
+        self.total = total
+
+
+def format_stdout(texts: List[str]) -> str:
+    """生成终端输出内容"""
+    lines = ["\n" + "="*50, "📊 市场价格快报", "="*50]
+    for i, text in enumerate(texts, 1):
+        lines.append(f"\n【{i}】 {text}")
+    lines.append("\n" + "="*50)
+    return "\n".join(lines)
 
 
 def publish_stdout(texts: List[str]) -> None:
     """输出到终端"""
-    print("\n" + "="*50)
-    print("📊 市场价格快报")
-    print("="*50)
-    for i, text in enumerate(texts, 1):
-        print(f"\n【{i}】 {text}")
-    print("\n" + "="*50)
+    print(format_stdout(texts))
 
 
-def publish_file(path: str, texts: List[str]) -> None:
-    """保存到文件"""
+def _write_file(path: str, texts: List[str]) -> None:
     # 确保目录存在
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
     
     with open(path, "w", encoding="utf-8") as f:
         f.write("市场价格快报\n")
         f.write("="*30 + "\n\n")
         for i, text in enumerate(texts, 1):
             f.write(f"【{i}】 {text}\n\n")
-    
+
+
+def publish_file(path: str, texts: List[str]) -> None:
+    """保存到文件"""
+    _write_file(path, texts)
     print(f"✅ 快报已保存到: {path}")
 
 
-def publish_wecom(webhook: str, texts: List[str]) -> None:
-    """推送到企业微信群"""
-    if not webhook:
-        print("❌ 企业微信webhook未配置")
-        return
+def _wecom_chunks(texts: List[str], max_bytes: int = WECOM_MAX_BYTES) -> List[str]:
+    """按企业微信文本长度上限（UTF-8 字节）拆分消息"""
+    header = "📊 市场价格快报"
+    chunks, current = [], header
+    for text in texts:
+        line = f"\n• {text}"
+        if current != header and len((current + line).encode("utf-8")) > max_bytes:
+            chunks.append(current)
+            current = header
+        current += line
+    chunks.append(current)
+    return chunks
+
+
+def _wecom_slot(webhook: str, rate_limit: int, window_sec: float) -> Tuple[float, Optional[float]]:
+    """
+    占用一个发送名额
+
+    Returns:
+        (需等待的秒数, 占位时刻)；窗口内名额已满时不占位，占位时刻为None
+    """
+    with _wecom_lock:
+        now = time.monotonic()
+        sent = _wecom_sent[webhook]
+        while sent and now - sent[0] >= window_sec:
+            sent.popleft()
+        if len(sent) >= rate_limit:
+            return sent[0] + window_sec - now, None
+        sent.append(now)
+        return 0.0, now
+
+
+def _wecom_settle(webhook: str, stamp: float) -> None:
+    """请求结束后把占位时刻改为结束时刻（服务端按到达时间计数，保守起见以结束时间计）"""
+    with _wecom_lock:
+        sent = _wecom_sent[webhook]
+        try:
+            sent.remove(stamp)
+        except ValueError:
+            pass
+        sent.append(time.monotonic())
+
+
+def _wecom_pacing_sec(webhook: str, n: int, rate_limit: int, window_sec: float) -> float:
+    """按当前窗口内已发送条数估算发完 n 条最少需要等待的秒数"""
+    with _wecom_lock:
+        now = time.monotonic()
+        sent = [t for t in _wecom_sent[webhook] if now - t < window_sec]
+    if len(sent) + n <= rate_limit:
+        return 0.0
+    anchor = sent[0] if sent else now
+    return max(0.0, anchor + window_sec * ((len(sent) + n - 1) // rate_limit) - now)
+
+
+def _post_wecom(webhook: str, texts: List[str], timeout: float = DEFAULT_TIMEOUT_SEC,
+                rate_limit: int = WECOM_RATE_LIMIT,
+                window_sec: float = WECOM_RATE_WINDOW_SEC) -> int:
+    """
+    推送到企业微信群（超长时拆分为多条，按机器人限频节流），返回发送条数
+
+    发送前按限频预估所需等待时间，超出 timeout 时一条不发直接失败；
+    已发出部分消息后失败时抛出 PartialDelivery，其余失败抛出 RuntimeError。
+    """
+    deadline = time.monotonic() + timeout
+    chunks = _wecom_chunks(texts)
+    pacing = _wecom_pacing_sec(webhook, len(chunks), rate_limit, window_sec)
+    if pacing > timeout:
+        raise RuntimeError(f"需发送 {len(chunks)} 条，受限频 {rate_limit} 条/{window_sec:g}s "
+                           f"约需 {pacing:.0f}s，超过超时 {timeout:g}s，未发送")
+
+    for i, content in enumerate(chunks):
+        try:
+            _send_wecom(webhook, content, deadline, rate_limit, window_sec)
+        except Exception as e:
+            if i == 0:
+                raise
+            raise PartialDelivery(i, len(chunks), str(e)) from e
+    return len(chunks)
+
+
+def _send_wecom(webhook: str, content: str, deadline: float,
+                rate_limit: int, window_sec: float) -> None:
+    """限频内发送单条消息，失败时抛出异常"""
+    while True:
+        wait, stamp = _wecom_slot(webhook, rate_limit, window_sec)
+        if stamp is not None:
+            break
+        if time.monotonic() + wait >= deadline:
+            raise RuntimeError(f"限频等待 {wait:.1f}s 超过剩余时间")
+        time.sleep(wait)
+
+    data = {
+        "msgtype": "text",
+        "text": {
+            "content": content
+        }
+    }
     
     try:
-        # 组装消息内容
-        content = "📊 市场价格快报\n" + "\n".join(f"• {text}" for text in texts)
-        
-        data = {
-            "msgtype": "text",
-            "text": {
-                "content": content
-            }
-        }
-        
         response = requests.post(
             webhook, 
-            data=json.dumps(data, ensure_ascii=False),
+            data=json.dumps(data, ensure_ascii=False).encode("utf-8"),
             headers={'Content-Type': 'application/json'},
-            timeout=10
+            timeout=max(0.1, deadline - time.monotonic())
         )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get("errcode") == 0:
-                print("✅ 企业微信推送成功")
-            else:
-                print(f"❌ 企业微信推送失败: {result.get('errmsg')}")
-        else:
-            print(f"❌ 企业微信推送失败: HTTP {response.status_code}")
-            
+    finally:
+        _wecom_settle(webhook, stamp)
+    
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    result = response.json()
+    if result.get("errcode") != 0:
+        raise RuntimeError(result.get("errmsg") or f"errcode {result.get('errcode')}")
+
+
+def publish_wecom(webhook: str, texts: List[str], timeout: float = DEFAULT_TIMEOUT_SEC) -> bool:
+    """推送到企业微信群，返回是否成功"""
+    if not webhook:
+        print("❌ 企业微信webhook未配置")
+        return False
+    
+    try:
+        _post_wecom(webhook, texts, timeout)
+        print("✅ 企业微信推送成功")
+        return True
     except Exception as e:
-        print(f"❌ 企业微信推送异常: {e}")
+        print(f"❌ 企业微信推送失败: {e}")
+        return False
+
+
+def resolve_targets(publisher_cfg: dict) -> List[dict]:
+    """
+    解析发布目标列表
+
+    优先使用 publisher.targets；未配置时按旧的 publisher.mode 生成单一目标。
+    """
+    targets = publisher_cfg.get("targets")
+    if not targets:
+        mode = publisher_cfg.get("mode", "stdout")
+        targets = [{
+            "type": mode,
+            "file_path": publisher_cfg.get("file_path"),
+            "webhook": publisher_cfg.get("wecom_webhook"),
+        }]
+
+    resolved = []
+    for i, t in enumerate(targets, 1):
+        t = dict(t)
+        t.setdefault("name", f"{t.get('type', 'unknown')}-{i}")
+        t.setdefault("format", "one_line")
+        t.setdefault("timeout_sec", publisher_cfg.get("timeout_sec", DEFAULT_TIMEOUT_SEC))
+        resolved.append(t)
+    return resolved
+
+
+def _deliver(target: dict, texts: List[str], run_date: str) -> Tuple[str, Optional[str]]:
+    """
+    投递到单个目标，失败时抛出异常
+
+    在投递线程中执行，不直接打印；终端内容返回给调用线程统一输出。
+
+    Returns:
+        (投递说明, 待输出到终端的内容)
+    """
+    kind = target.get("type")
+    if kind == "stdout":
+        return "已输出到终端", format_stdout(texts)
+    elif kind == "file":
+        path = target.get("file_path")
+        if not path:
+            raise ValueError("file_path未配置")
+        path = path.replace("{{date}}", run_date)
+        _write_file(path, texts)
+        return f"已保存到 {path}", None
+    elif kind == "wecom":
+        webhook = target.get("webhook")
+        if not webhook:
+            raise ValueError("企业微信webhook未配置")
+        sent = _post_wecom(webhook, texts, timeout=float(target["timeout_sec"]),
+                           rate_limit=int(target.get("rate_limit", WECOM_RATE_LIMIT)),
+                           window_sec=float(target.get("rate_window_sec", WECOM_RATE_WINDOW_SEC)))
+        return f"已发送 {sent} 条", None
+    else:
+        raise ValueError(f"不支持的发布类型: {kind}")
+
+
+def publish_targets(targets: List[dict], outputs: List[BulletinOutput], run_date: str) -> List[DeliveryResult]:
+    """
+    并发投递到多个目标，各目标独立超时、互不影响
+
+    投递线程不打印；终端目标的内容在全部结果收齐后由调用线程按目标顺序输出，不会交错。
+    投递在守护线程中执行，超时后仍悬挂的投递不会阻止进程退出。
+
+    Args:
+        targets: resolve_targets 解析后的目标列表
+        outputs: 本次生成的快报
+        run_date: 运行日期（替换路径中的 {{date}}）
+
+    Returns:
+        各目标的投递结果（顺序同 targets）
+    """
+    if not targets:
+        return []
+
+    def task(target):
+        started = time.monotonic()
+        texts = [getattr(o, target["format"]) for o in outputs]
+        detail, console = _deliver(target, texts, run_date)
+        return time.monotonic() - started, detail, console
+
+    executor = DaemonPool(max_workers=len(targets), thread_name_prefix="publish")
+    started = time.monotonic()
+    futures = []
+    for target in targets:
+        if target["format"] not in FORMATS:
+            futures.append(ValueError(f"不支持的格式: {target['format']}"))
+        else:
+            futures.append(executor.submit(task, target))
+
+    results, console_blocks = [], []
+    for target, fut in zip(targets, futures):
+        result = DeliveryResult(name=target["name"], type=str(target.get("type")),
+                                format=target["format"], status="failed")
+        if isinstance(fut, Exception):
+            result.error = str(fut)
+            results.append(result)
+            continue
+
+        timeout = float(target["timeout_sec"])
+        try:
+            elapsed, result.detail, console = fut.result(timeout=max(0.0, started + timeout - time.monotonic()))
+            result.elapsed_sec = round(elapsed, 3)
+            result.status = "ok"
+            if console:
+                console_blocks.append(console)
+        except PartialDelivery as e:
+            result.status = "partial"
+            result.elapsed_sec = round(time.monotonic() - started, 3)
+            result.error = str(e)
+        except FutureTimeout:
+            result.status = "timeout"
+            result.elapsed_sec = round(time.monotonic() - started, 3)
+            result.error = f"超过 {timeout:g}s 未完成"
+        except Exception as e:
+            result.elapsed_sec = round(time.monotonic() - started, 3)
+            result.error = str(e)
+        results.append(result)
+
+    executor.shutdown(wait=False, cancel_futures=True)
+    for block in console_blocks:
+        print(block)
+    return results
+
+
+def format_delivery_summary(results: List[DeliveryResult]) -> str:
+    """生成投递汇总文本"""
+    icons = {"ok": "✅", "partial": "⚠", "failed": "❌", "timeout": "⏱"}
+    lines = [f"投递汇总: {sum(r.status == 'ok' for r in results)}/{len(results)} 成功"]
+    for r in results:
+        line = f"  {icons.get(r.status, '?')} {r.name} [{r.type}/{r.format}] {r.status} {r.elapsed_sec:.2f}s"
+        if r.error:
+            line += f" - {r.error}"
+        elif r.detail:
+            line += f" - {r.detail}"
+        lines.append(line)
+    return "\n".join(lines)
 
 
 def publish_markdown(texts: List[str], title: str = "市场价格快报") -> str:
@@ -40,9 +40,9 @@ def render_one_line(rec: DataRecord, met: DerivedMetrics, style: dict, rules: di
 
     # 平稳 ⇒ 不显示括号
     if met.trend == "flat":
-        return f"{date_str}，{rec.scope}{rec.commodity}均价{_fmt_num(rec.price_cur)}{rec.unit}，较昨日{dir_word}。{src}"
+        return f"{date_str}，{rec.scope}{rec.commodity}{rec.price_label}{_fmt_num(rec.price_cur)}{rec.unit}，较昨日{dir_word}。{src}"
 
-    return (f"{date_str}，{rec.scope}{rec.commodity}均价{_fmt_num(rec.price_cur)}{rec.unit}，"
+    return (f"{date_str}，{rec.scope}{rec.commodity}{rec.price_label}{_fmt_num(rec.price_cur)}{rec.unit}，"
             f"较昨日{dir_word}{_fmt_pct(abs(d1))}（{_fmt_num(d1_abs)}{rec.unit}）。{src}")
 
 
@@ -90,6 +90,19 @@ def render_three_lines(rec: DataRecord, met: DerivedMetrics, style: dict, rules:
     return "\n".join([line for line in lines if line]).strip()
 
 
+def _format_ref_factors(rec: DataRecord) -> str:
+    """各参考期的换算系数（如 D-1=0.0071, W-1=archived(未换算), M-1=缺失）"""
+    parts = []
+    for code, price in rec.refs.items():
+        if price is None:
+            parts.append(f"{code}=缺失")
+        elif code in rec.ref_factors and rec.ref_factors[code] is None:
+            parts.append(f"{code}=archived(未换算)")
+        else:
+            parts.append(f"{code}={rec.ref_factors.get(code, rec.unit_factor):.6g}")
+    return ", ".join(parts)
+
+
 def render_output(rec: DataRecord, met: DerivedMetrics, style: dict, rules: dict) -> BulletinOutput:
     """
     渲染完整输出
@@ -111,6 +124,9 @@ def render_output(rec: DataRecord, met: DerivedMetrics, style: dict, rules: dict
             "scope": rec.scope,
             "price_type": rec.price_type,
             "unit": rec.unit,
+            "source_unit": rec.source_unit or rec.unit,
+            "unit_factor": f"{rec.unit_factor:.6g}",
+            "ref_factors": _format_ref_factors(rec),
             "source": rec.source_name,
             "spec_version": "1.0.0",
             "anomaly": str(met.anomaly),
@@ -6,11 +6,12 @@ from datetime import date, datetime, timedelta
 
 
 def fetch_price(date_str: str, commodity: str, scope: str,
-                price_type: str, unit: str) -> Optional[float]:
+                price_type: str, unit: str, timeout: Optional[float] = None) -> Optional[float]:
     """
     返回当日（或最近一期）价格（统一到 unit）。
     TODO: 在这里写上你的查询语句/HTTP调用/CSV读取逻辑。
     若无日频、但有周频，可按配置回退到最新周价。
+    上游错误请抛出异常（而非返回None），以便熔断器计数。
     
     Args:
         date_str: 查询日期 "YYYY-MM-DD"
@@ -18,6 +19,7 @@ def fetch_price(date_str: str, commodity: str, scope: str,
         scope: 市场范围，如"全国批发市场"
         price_type: 价格类型，如"wholesale"
         unit: 单位，如"元/公斤"
+        timeout: 本次调用可用秒数（来自运行截止预算），请传给底层请求
     
     Returns:
         价格浮点数，若无数据返回None
@@ -39,7 +41,8 @@ def fetch_price(date_str: str, commodity: str, scope: str,
 
 
 def fetch_ref_price(anchor_date: str, commodity: str, scope: str,
-                    price_type: str, unit: str, ref_code: str) -> Optional[float]:
+                    price_type: str, unit: str, ref_code: str,
+                    timeout: Optional[float] = None) -> Optional[float]:
     """
     返回参考期（D-1/W-1/M-1）价格。若缺，返回None。
     你可以在内部计算 ref_date 并查询。
@@ -51,6 +54,7 @@ def fetch_ref_price(anchor_date: str, commodity: str, scope: str,
         price_type: 价格类型
         unit: 单位
         ref_code: 参考期代码，如"D-1"(昨日)、"W-1"(上周)、"M-1"(上月)
+        timeout: 本次调用可用秒数（来自运行截止预算），请传给底层请求
     
     Returns:
         参考期价格，若无数据返回None
@@ -98,11 +102,22 @@ def fetch_price_from_csv(date_str: str, commodity: str, csv_path: str = "data/pr
     return None
 
 
-def fetch_price_from_db(date_str: str, commodity: str, db_config: dict) -> Optional[float]:
-    """从PostgreSQL数据库查询价格的参考实现"""
+def fetch_price_from_db(date_str: str, commodity: str, db_config: dict,
+                        timeout: Optional[float] = None, raise_errors: bool = False,
+                        connect=None) -> Optional[float]:
+    """
+    从PostgreSQL数据库查询价格的参考实现（timeout 用作连接超时）
+
+    connect 可替换连接函数（需兼容 psycopg2 的 %s 占位符），默认 psycopg2.connect。
+    """
     try:
-        import psycopg2
-        conn = psycopg2.connect(**db_config)
+        if connect is None:
+            import psycopg2
+            connect = psycopg2.connect
+        conn_args = dict(db_config)
+        if timeout is not None:
+            conn_args.setdefault("connect_timeout", max(1, int(timeout)))
+        conn = connect(**conn_args)
         cursor = conn.cursor()
         
         query = """
@@ -116,12 +131,19 @@ def fetch_price_from_db(date_str: str, commodity: str, db_config: dict) -> Optio
         conn.close()
         return float(result[0]) if result else None
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"数据库查询错误: {e}")
     return None
 
 
-def fetch_price_from_api(date_str: str, commodity: str, api_config: dict) -> Optional[float]:
-    """从HTTP API查询价格的参考实现"""
+def fetch_price_from_api(date_str: str, commodity: str, api_config: dict,
+                         timeout: Optional[float] = 10, raise_errors: bool = False) -> Optional[float]:
+    """
+    从HTTP API查询价格的参考实现
+
+    raise_errors=True 时网络错误和非 200/404 响应会抛出异常（供熔断器计数）。
+    """
     try:
         import requests
         
@@ -134,10 +156,14 @@ def fetch_price_from_api(date_str: str, commodity: str, api_config: dict) -> Opt
         }
         headers = {'Authorization': f"Bearer {api_config.get('token', '')}"}
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = requests.get(url, params=params, headers=headers, timeout=timeout)
         if response.status_code == 200:
             data = response.json()
             return float(data.get('price'))
+        if response.status_code != 404 and raise_errors:
+            response.raise_for_status()
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"API查询错误: {e}")
     return None
\ No newline at end of file
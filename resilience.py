@@ -0,0 +1,238 @@
+"""
+取数韧性模块 - 运行截止预算、对冲请求、熔断器
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from utils import DaemonPool
+
+
+class Deadline:
+    """单次运行的时间预算（单调时钟）"""
+
+    def __init__(self, budget_sec: float, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._end = clock() + max(0.0, budget_sec)
+
+    def remaining(self) -> float:
+        """剩余秒数（不小于0）"""
+        return max(0.0, self._end - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+
+def budget_from_config(fetch_cfg: dict, now: Optional[datetime] = None) -> float:
+    """
+    由配置计算本次运行的取数预算
+
+    deadline_sec 为总预算；若配置了 deadline_at（"HH:MM"，当天），取两者中较早者。
+    """
+    budget = float(fetch_cfg.get("deadline_sec", 600))
+    deadline_at = fetch_cfg.get("deadline_at")
+    if deadline_at:
+        now = now or datetime.now()
+        hh, mm = (int(x) for x in str(deadline_at).split(":"))
+        cutoff = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+        if cutoff <= now:
+            cutoff += timedelta(days=1)
+        budget = min(budget, (cutoff - now).total_seconds())
+    return budget
+
+
+class LatencyTracker:
+    """滑动窗口内的调用耗时，用于估计 p95"""
+
+    def __init__(self, window: int = 100, min_samples: int = 5):
+        self._samples = deque(maxlen=window)
+        self._min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        """样本不足时返回None"""
+        with self._lock:
+            if len(self._samples) < self._min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，reset_sec 后半开放行一次试探
+
+    closed → open → half_open →（成功）closed /（失败）open
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_sec: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_sec:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """是否放行本次调用（半开状态只放行一个试探请求）"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+class GuardedFetcher:
+    """
+    带截止预算、对冲请求和熔断的取数包装
+
+    被包装的函数需接受 timeout 关键字参数，并在上游错误时抛出异常（返回None表示无数据）。
+    预算耗尽、熔断打开或全部尝试失败时返回None，由调用方走缺失处理。
+    调用在守护线程中执行，超时后仍悬挂的调用不会阻止进程退出。可被多个线程并发调用。
+    """
+
+    def __init__(self, deadline: Deadline, call_timeout_sec: float = 10.0,
+                 hedge: bool = True, hedge_after_sec: float = 2.0,
+                 breaker_failures: int = 3, breaker_reset_sec: float = 60.0,
+                 max_workers: int = 8, logger: Optional[logging.Logger] = None):
+        self.deadline = deadline
+        self.call_timeout_sec = call_timeout_sec
+        self.hedge = hedge
+        self.hedge_after_sec = hedge_after_sec
+        self._breaker_args = (breaker_failures, breaker_reset_sec)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._executor = DaemonPool(max_workers=max_workers, thread_name_prefix="fetch")
+        self._logger = logger or logging.getLogger("market_bulletin")
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "hedged": 0, "failures": 0, "timeouts": 0,
+                      "short_circuited": 0, "budget_exhausted": 0}
+
+    @classmethod
+    def from_config(cls, fetch_cfg: dict, logger: Optional[logging.Logger] = None) -> "GuardedFetcher":
+        """由 fetch 配置段构建"""
+        return cls(
+            deadline=Deadline(budget_from_config(fetch_cfg)),
+            call_timeout_sec=float(fetch_cfg.get("call_timeout_sec", 10)),
+            hedge=bool(fetch_cfg.get("hedge", True)),
+            hedge_after_sec=float(fetch_cfg.get("hedge_after_sec", 2.0)),
+            breaker_failures=int(fetch_cfg.get("breaker_failures", 3)),
+            breaker_reset_sec=float(fetch_cfg.get("breaker_reset_sec", 60)),
+            max_workers=int(fetch_cfg.get("max_workers", 16)),
+            logger=logger,
+        )
+
+    def breaker(self, source: str) -> CircuitBreaker:
+        with self._lock:
+            if source not in self._breakers:
+                self._breakers[source] = CircuitBreaker(*self._breaker_args)
+                self._latency[source] = LatencyTracker()
+            return self._breakers[source]
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def call(self, source: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在预算内调用 fn(*args, timeout=..., **kwargs)
+
+        Args:
+            source: 数据源标识（熔断与延迟统计按此分组）
+            fn: 适配函数
+
+        Returns:
+            fn 的返回值；失败、超时、熔断或预算耗尽时返回None
+        """
+        breaker = self.breaker(source)
+        tracker = self._latency[source]
+
+        if self.deadline.expired:
+            self._count("budget_exhausted")
+            self._logger.warning(f"取数预算已耗尽，跳过 {source}{args}")
+            return None
+        if not breaker.allow():
+            self._count("short_circuited")
+            self._logger.warning(f"{source} 熔断中，跳过调用")
+            return None
+
+        budget = min(self.call_timeout_sec, self.deadline.remaining())
+        started = time.monotonic()
+        self._count("calls")
+        pending = {self._executor.submit(fn, *args, timeout=budget, **kwargs)}
+
+        hedge_delay = tracker.p95() or self.hedge_after_sec
+        if self.hedge and hedge_delay < budget:
+            done, pending = wait(pending, timeout=hedge_delay)
+            if not done:
+                self._count("hedged")
+                self._logger.info(f"{source} 超过 {hedge_delay:.2f}s 未返回，发起对冲请求")
+                remaining = max(0.0, budget - (time.monotonic() - started))
+                pending.add(self._executor.submit(fn, *args, timeout=remaining, **kwargs))
+            else:
+                pending = done
+
+        error = None
+        while pending:
+            remaining = budget - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    tracker.record(time.monotonic() - started)
+                    breaker.record_success()
+                    return fut.result()
+                error = fut.exception()
+
+        if error is not None and not pending:
+            self._count("failures")
+            self._logger.warning(f"{source} 调用失败: {error}")
+        else:
+            self._count("timeouts")
+            self._logger.warning(f"{source} 调用超时（{budget:.2f}s）")
+        breaker.record_failure()
+        return None
+
+    def close(self) -> None:
+        """释放线程池（不等待悬挂中的调用，守护线程不阻止进程退出）"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
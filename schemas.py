@@ -25,10 +25,14 @@ class DataRecord(BaseModel):
     unit: str
     asof_date: str
     price_cur: float
-    refs: Dict[str, float] = Field(default_factory=dict)  # {"D-1": 20.95, "W-1": 21.10, ...}
+    refs: Dict[str, Optional[float]] = Field(default_factory=dict)  # {"D-1": 20.95, "W-1": None, ...}，None 为缺失
     source_name: str
     source_url: Optional[str] = None
     notes: Optional[str] = ""
+    source_unit: Optional[str] = None                              # 数据源原始单位（为空即 unit）
+    unit_factor: float = 1.0                                       # 原始单位 → unit 的换算系数
+    ref_factors: Dict[str, Optional[float]] = Field(default_factory=dict)  # 参考期换算系数，None 为取自存档（未换算）
+    price_label: str = "均价"                                      # 文案中的价格措辞（指数为"报"）
 
 
 class DerivedMetrics(BaseModel):
@@ -44,4 +48,15 @@ class BulletinOutput(BaseModel):
     """快报输出"""
     one_line: str
     three_lines: str
-    audit: Dict[str, str] = Field(default_factory=dict)           # 来源、口径、版本等
\ No newline at end of file
+    audit: Dict[str, str] = Field(default_factory=dict)           # 来源、口径、版本等
+
+
+class DeliveryResult(BaseModel):
+    """单个发布目标的投递结果"""
+    name: str
+    type: str
+    format: str
+    status: str                                                    # ok/partial/failed/timeout
+    elapsed_sec: float = 0.0
+    detail: Optional[str] = None                                   # 成功时的投递说明
+    error: Optional[str] = None
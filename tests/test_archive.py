@@ -0,0 +1,85 @@
+"""
+归档模块测试
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import DataRecord
+from derive import derive_metrics
+from render import render_output
+from archive import open_archive, save_bulletins, query_history, fetch_archived_ref, ref_date_window
+
+
+RULES = {"flat_threshold_pct": 0.3, "hint_trigger_pct": 1.0, "anomaly_pct": 8.0}
+STYLE = {"include_source": True, "include_hint": "auto"}
+
+
+def _item(asof_date: str, commodity: str, price: float):
+    rec = DataRecord(
+        commodity=commodity,
+        scope="全国批发市场",
+        price_type="wholesale",
+        unit="元/公斤",
+        asof_date=asof_date,
+        price_cur=price,
+        refs={"D-1": price - 0.5},
+        source_name="农业农村部监测"
+    )
+    met = derive_metrics(rec, RULES)
+    return rec, met, render_output(rec, met, STYLE, RULES)
+
+
+def test_archive_roundtrip():
+    """测试批量写入、区间查询与参考期回读"""
+    conn = open_archive(":memory:")
+    items = [_item(f"2025-03-{d:02d}", c, 80.0 + d)
+             for d in range(1, 32) for c in ("黑胡椒", "猪肉")]
+    assert save_bulletins(conn, items) == 62
+
+    # 重复写入覆盖而非新增
+    save_bulletins(conn, items[:2])
+    assert conn.execute("SELECT COUNT(*) FROM bulletins").fetchone()[0] == 62
+
+    rows = query_history(conn, "黑胡椒", "2025-03-10", "2025-03-12")
+    assert [r["asof_date"] for r in rows] == ["2025-03-10", "2025-03-11", "2025-03-12"]
+    assert rows[0]["metrics"]["trend"] == "up"
+    assert rows[0]["audit"]["unit"] == "元/公斤"
+
+    assert fetch_archived_ref(conn, "2025-03-31", "黑胡椒", "全国批发市场",
+                              "wholesale", "元/公斤", "D-1") == 110.0
+    assert fetch_archived_ref(conn, "2025-03-31", "黑胡椒", "全国批发市场",
+                              "wholesale", "元/公斤", "W-1") == 104.0
+    # 单位不一致或无存档视为缺失
+    assert fetch_archived_ref(conn, "2025-03-31", "黑胡椒", "全国批发市场",
+                              "wholesale", "元/斤", "D-1") is None
+    assert fetch_archived_ref(conn, "2025-03-01", "黑胡椒", "全国批发市场",
+                              "wholesale", "元/公斤", "M-1") is None
+    conn.close()
+
+
+def test_archived_ref_gap_falls_back():
+    """测试存档缺口：陈旧或漏跑日期不得冒充参考期"""
+    conn = open_archive(":memory:")
+    # 2024-01-05 的孤立记录；2025-08-15(周五)、2025-08-18(周一) 有发布，2025-08-19(周二) 漏跑
+    save_bulletins(conn, [_item("2024-01-05", "猪肉", 19.0),
+                          _item("2025-08-15", "猪肉", 20.1),
+                          _item("2025-08-18", "猪肉", 20.4)])
+
+    def ref(anchor, code):
+        return fetch_archived_ref(conn, anchor, "猪肉", "全国批发市场", "wholesale", "元/公斤", code)
+
+    # 19 个月前的记录不能当作 D-1
+    assert ref("2024-03-01", "D-1") is None
+    # 周三的 D-1 是漏跑的周二，不顺延到周一
+    assert ref("2025-08-20", "D-1") is None
+    # 周一的 D-1 落在周日，顺延到周五
+    assert ref_date_window("2025-08-18", "D-1") == ("2025-08-15", "2025-08-17")
+    assert ref("2025-08-18", "D-1") == 20.1
+    assert ref("2025-08-19", "D-1") == 20.4
+    conn.close()
+
+
+if __name__ == "__main__":
+    test_archive_roundtrip()
+    test_archived_ref_gap_falls_back()
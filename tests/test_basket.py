@@ -0,0 +1,131 @@
+"""
+加权指数测试
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from schemas import DataRecord
+from derive import derive_metrics
+from render import render_output
+from basket import IndexBook
+from archive import open_archive, load_index_bases
+from main import build_index_records
+from utils import setup_logger
+
+
+PERIODS = ["cur", "D-1", "W-1", "M-1"]
+BASKETS = [
+    {"name": "综合指数", "weights": {"粮油指数": 0.5, "肉类指数": 0.5}},
+    {"name": "粮油指数", "weights": {"大米": 0.6, "食用油": 0.4}},
+    {"name": "肉类指数", "weights": {"猪肉": 1.0}, "base": {"猪肉": 20.0}},
+]
+PRICES = {
+    "大米": [4.50, 4.48, 4.52, 4.35],
+    "食用油": [15.0, 15.0, 14.8, None],
+    "猪肉": [20.80, 20.95, 21.10, 20.10],
+}
+
+
+def test_index_levels():
+    """测试分层加权、基期与缺失成分重新归一"""
+    book = IndexBook(BASKETS, PERIODS)
+    assert book.order.index("综合指数") > book.order.index("粮油指数")
+    book.load(PRICES)
+
+    assert book.levels("肉类指数")[0] == pytest.approx(104.0)
+    # 未配置基期的成分以首次载入的当期价为基期（大米 4.50 / 食用油 15.0 → 当期 100 点）
+    assert book.levels("粮油指数")[0] == pytest.approx(100.0)
+    assert book.new_bases == {"粮油指数": {"大米": 4.50, "食用油": 15.0}}
+    # M-1 期食用油缺失，仅大米参与
+    assert book.levels("粮油指数")[3] == pytest.approx(100 * 4.35 / 4.50)
+    expected = 100 * (0.6 * 4.52 / 4.50 + 0.4 * 14.8 / 15.0)
+    assert book.levels("粮油指数")[2] == pytest.approx(expected)
+    assert book.levels("综合指数")[0] == pytest.approx((100.0 + 104.0) / 2)
+
+    with pytest.raises(ValueError):
+        IndexBook([{"name": "A", "weights": {"B": 1}}, {"name": "B", "weights": {"A": 1}}], PERIODS)
+
+
+def test_incremental_update_matches_full_load():
+    """测试增量更新与整体重算一致"""
+    book = IndexBook(BASKETS, PERIODS)
+    book.load(PRICES)
+    assert book.update("猪肉", [22.0, 20.95, 21.10, 20.10]) == ["肉类指数", "综合指数"]
+    book.update("食用油", [None, 15.0, 14.8, 14.6])
+
+    # 基期在首次载入时确定，整体重算时作为已固定基期沿用
+    full = IndexBook(BASKETS, PERIODS, bases=book.new_bases)
+    full.load({**PRICES, "猪肉": [22.0, 20.95, 21.10, 20.10], "食用油": [None, 15.0, 14.8, 14.6]})
+    for name in full.order:
+        np.testing.assert_allclose(book.levels(name), full.levels(name))
+
+
+def test_index_record_renders():
+    """测试指数合成记录走派生指标与渲染"""
+    book = IndexBook(BASKETS, PERIODS)
+    book.load(PRICES)
+    template = DataRecord(commodity="猪肉", scope="全国批发市场", price_type="wholesale",
+                          unit="元/公斤", asof_date="2025-08-21", price_cur=20.80,
+                          source_name="农业农村部监测")
+    rec = book.to_record("肉类指数", template)
+    assert rec.unit == "点" and rec.refs["M-1"] == pytest.approx(100.5)
+
+    rules = {"flat_threshold_pct": 0.3, "hint_trigger_pct": 1.0, "anomaly_pct": 8.0}
+    out = render_output(rec, derive_metrics(rec, rules), {"include_source": True}, rules)
+    assert out.one_line.startswith("2025-08-21，全国批发市场肉类指数报104.00点，较昨日下降")
+
+
+def test_ref_compared_on_matched_constituents():
+    """测试成分仅缺参考价时按同口径比较，不误报涨跌"""
+    book = IndexBook([{"name": "X", "weights": {"A": 0.5, "B": 0.5}, "base": {"A": 10.0, "B": 10.0}}],
+                     ["cur", "D-1"])
+    book.load({"A": [10.0, 10.0], "B": [13.0, None]})
+    np.testing.assert_allclose(book.levels("X"), [115.0, 115.0])
+    np.testing.assert_allclose(book.coverage("X"), [1.0, 0.5])
+
+    # A 上涨 2%：D-1 只比较 A，点位比值即 A 的涨幅
+    assert book.update("A", [10.2, 10.0]) == ["X"]
+    levels = book.levels("X")
+    assert levels[0] == pytest.approx(116.0)
+    assert levels[0] / levels[1] == pytest.approx(1.02)
+
+    rec = book.to_record("X", DataRecord(commodity="A", scope="全国批发市场", price_type="wholesale",
+                                         unit="元/公斤", asof_date="2025-08-21", price_cur=10.2,
+                                         source_name="农业农村部监测"))
+    rules = {"flat_threshold_pct": 0.3, "hint_trigger_pct": 1.0, "anomaly_pct": 8.0}
+    met = derive_metrics(rec, rules)
+    assert met.delta_pct["D-1"] == pytest.approx(2.0, abs=0.01) and not met.anomaly
+
+
+def _record(date, cur, refs):
+    return DataRecord(commodity="大米", scope="全国批发市场", price_type="wholesale",
+                      unit="元/公斤", asof_date=date, price_cur=cur,
+                      refs=dict(zip(PERIODS[1:], refs)), source_name="农业农村部监测")
+
+
+def test_index_base_fixed_across_days():
+    """测试连续两天运行：基期固定在归档中，点位不随 M-1 漂移"""
+    cfg = {"references": PERIODS[1:], "baskets": [{"name": "粮油指数", "weights": {"大米": 1.0}}]}
+    logger = setup_logger(level="WARNING")
+    conn = open_archive(":memory:")
+
+    day1 = build_index_records(cfg, [_record("2025-08-21", 110.0, [105.0, 100.0, 100.0])],
+                               logger, archive_conn=conn)[0]
+    assert day1.price_cur == pytest.approx(100.0)
+    assert load_index_bases(conn) == {"粮油指数": {"大米": 110.0}}
+
+    # 次日价格不变、M-1 不同：点位仍为 100，D-1 即前一日发布的点位
+    day2 = build_index_records(cfg, [_record("2025-08-22", 110.0, [110.0, 104.0, 105.0])],
+                               logger, archive_conn=conn)[0]
+    assert day2.price_cur == pytest.approx(100.0)
+    assert day2.refs["D-1"] == pytest.approx(day1.price_cur)
+    assert day2.refs["M-1"] == pytest.approx(100 * 105.0 / 110.0, abs=1e-4)
+    assert load_index_bases(conn) == {"粮油指数": {"大米": 110.0}}
+
+    # 未启用归档且未配置基期时拒绝计算（否则每次运行都会重新定基）
+    with pytest.raises(ValueError):
+        build_index_records(cfg, [_record("2025-08-22", 110.0, [110.0, 104.0, 105.0])], logger)
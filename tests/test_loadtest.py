@@ -0,0 +1,56 @@
+"""
+压测工具冒烟测试（小规模）
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+
+import pytest
+
+from loadtest import run_loadtest, check_gates, format_report, FakeWecom
+from publisher import _post_wecom, PartialDelivery
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.cfg.yaml")
+
+
+def test_loadtest_end_to_end():
+    """测试替身数据源与推送端点跑通完整流程，并触发限频"""
+    report = run_loadtest(n_commodities=12, days=35, runs=2, latency_ms=1, jitter_ms=0,
+                          wecom_groups=2, wecom_rate_limit=1, config_path=CONFIG)
+
+    assert report["bulletins"] == 12 + 3  # 12 个品类 + 2 个分组指数 + 综合指数
+    assert report["price_api_requests"] >= 2 * 4 * 4  # 每次运行 4 个 api 品类 × 4 期
+    assert report["fetch_stats"]["failures"] == 0
+    assert {"fetch", "derive", "render", "archive", "publish", "total"} <= set(report["stages"])
+    assert report["stages"]["total"]["count"] == 2
+    assert report["peak_mem_mb"] > 0
+
+    # 每群 1 条/分钟：超出限频的目标在发送前拒绝，不再触发 45009
+    assert report["wecom"]["rate_limited"] == 0
+    assert report["wecom"]["oversize"] == 0  # 超长消息已按 2048 字节拆分
+    status = {d["name"]: d["status"] for d in report["deliveries"]}
+    assert status == {"文件-一句话": "ok", "文件-三句话": "ok", "群1": "failed", "群2": "failed"}
+    assert all("未发送" in d["error"] for d in report["deliveries"] if d["status"] == "failed")
+    assert check_gates(report, max_peak_mb=1e6) == ["投递失败: 群1, 群2"]
+    assert check_gates(report, require_delivery=False) == []
+    assert "压测报告" in format_report(report)
+
+
+def test_wecom_pacing_and_partial_delivery():
+    """测试企业微信按限频节流发送；超出替身限频时报告部分投递"""
+    texts = ["价" * 300 for _ in range(10)]  # 每条约 900 字节，拆为 5 条消息
+
+    with FakeWecom(rate_limit=2, window_sec=0.5) as wecom:
+        started = time.monotonic()
+        assert _post_wecom(wecom.webhook("paced"), texts, timeout=5, rate_limit=2, window_sec=0.5) == 5
+        assert time.monotonic() - started >= 1.0
+        assert wecom.counts["accepted"] == 5 and wecom.counts["rate_limited"] == 0
+
+        # 发送端按 10 条/窗口发送，替身只接受 2 条：已发 2 条后失败
+        with pytest.raises(PartialDelivery) as exc:
+            _post_wecom(wecom.webhook("burst"), texts, timeout=5, rate_limit=10, window_sec=0.5)
+        assert (exc.value.sent, exc.value.total) == (2, 5)
+        assert "api freq out of limit" in str(exc.value)
+        assert wecom.counts["rate_limited"] == 1
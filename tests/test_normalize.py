@@ -0,0 +1,91 @@
+"""
+单位归一测试
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from normalize import UnitNormalizer, parse_unit, load_fx, load_fx_for_date
+
+
+def test_parse_unit():
+    """测试计价单位解析"""
+    assert parse_unit("元/斤") == ("CNY", 0.5)
+    assert parse_unit("USD/吨") == ("USD", 1000.0)
+    with pytest.raises(ValueError):
+        parse_unit("元每斤")
+
+
+def test_convert_batch(tmp_path):
+    """测试整组换算、系数缓存与汇率文件"""
+    fx_path = tmp_path / "fx.csv"
+    fx_path.write_text("currency,rate\nUSD,7.10\n", encoding="utf-8")
+
+    norm = UnitNormalizer("元/公斤", fx=load_fx(str(fx_path)),
+                          source_units={"黑胡椒": "USD/吨", "大米": "元/斤"})
+
+    assert norm.source_unit("猪肉") == "元/公斤"
+    assert norm.convert([20.8, None], "元/公斤") == [20.8, None]
+    assert norm.convert([2.25, 2.24, None], norm.source_unit("大米")) == [4.5, 4.48, None]
+    assert norm.convert([12000.0], "USD/吨") == [85.2]
+    assert norm.factor("元/吨") == pytest.approx(0.001)
+    assert set(norm._factors) == {("元/斤", None), ("USD/吨", None), ("元/吨", None)}  # 同单位不解析
+
+    with pytest.raises(ValueError):
+        UnitNormalizer("元/公斤").factor("USD/吨")
+
+
+def test_convert_matrix_dated_fx(tmp_path):
+    """测试整批矩阵换算：各期按自身日期汇率，缺汇率处为 nan"""
+    (tmp_path / "2025-03-15.csv").write_text("currency,rate\nUSD,7.20\n", encoding="utf-8")
+    (tmp_path / "2025-03-14.csv").write_text("currency,rate\nUSD,7.00\n", encoding="utf-8")
+    fx_file = str(tmp_path / "{{date}}.csv")
+
+    # 周日无汇率文件，顺延到周六
+    assert load_fx_for_date(fx_file, "2025-03-16", carry_days=1)["USD"] == 7.20
+    assert load_fx_for_date(fx_file, "2025-03-20", carry_days=1) is None
+
+    norm = UnitNormalizer("元/公斤", fx=load_fx_for_date(fx_file, "2025-03-15"),
+                          fx_loader=lambda d: load_fx_for_date(fx_file, d, carry_days=0))
+    converted, factors = norm.convert_matrix(
+        [[1000.0, 1000.0, 1000.0], [2.25, 2.24, float("nan")]],
+        ["USD/吨", "元/斤"],
+        ["2025-03-15", "2025-03-14", "2025-02-13"],
+    )
+
+    assert converted[0, :2].tolist() == [7.2, 7.0]
+    assert np.isnan(converted[0, 2]) and np.isnan(factors[0, 2])
+    assert converted[1, :2].tolist() == [4.5, 4.48]
+    assert np.isnan(converted[1, 2]) and factors[1, 2] == 2.0
+
+
+def test_unlisted_unit_only_fails_conversions():
+    """测试计量单位表外的单位：无需换算时照常发布，需换算的品类单独按缺失处理"""
+    import logging
+    from main import build_records
+    from render import render_output
+    from derive import derive_metrics
+
+    norm = UnitNormalizer("元/只", source_units={"进口鸡": "USD/吨"})
+    assert norm.factor("元/只") == 1.0
+    with pytest.raises(ValueError):
+        norm.factor("USD/吨")
+
+    cfg = {"unit": "元/只", "scope": "全国批发市场", "price_type": "wholesale",
+           "references": ["D-1", "W-1", "M-1"]}
+    quotes = [
+        {"commodity": "活鸡", "source_unit": "元/只",
+         "fetched": {"cur": 30.0, "D-1": 29.5, "W-1": None}, "archived": {"M-1": 28.0}},
+        {"commodity": "进口鸡", "source_unit": "USD/吨",
+         "fetched": {"cur": 3000.0, "D-1": None, "W-1": None, "M-1": None}, "archived": {}},
+    ]
+    records = build_records(quotes, "2025-08-21", cfg, logging.getLogger("market_bulletin"), norm)
+    assert [r.commodity for r in records] == ["活鸡"]
+    assert records[0].ref_factors == {"D-1": 1.0, "M-1": None}
+
+    rules = {"flat_threshold_pct": 0.3, "hint_trigger_pct": 1.0, "anomaly_pct": 8.0}
+    out = render_output(records[0], derive_metrics(records[0], rules), {"include_source": True}, rules)
+    assert out.audit["ref_factors"] == "D-1=1, W-1=缺失, M-1=archived(未换算)"
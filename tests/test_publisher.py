@@ -0,0 +1,127 @@
+"""
+多目标发布测试
+"""
+import sys
+import os
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import BulletinOutput
+from publisher import resolve_targets, publish_targets, format_delivery_summary
+
+
+def _start_webhook_server():
+    """本地企业微信桩：/ok 成功，/slow 延迟 2s，/err 返回错误码"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+            received.append((self.path, body["text"]["content"]))
+            if self.path == "/slow":
+                time.sleep(2.0)
+            errcode = 93000 if self.path == "/err" else 0
+            payload = json.dumps({"errcode": errcode, "errmsg": "invalid webhook url" if errcode else "ok"})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(payload.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", received
+
+
+def test_resolve_targets_legacy_mode():
+    """测试旧 mode 配置兼容"""
+    targets = resolve_targets({"mode": "wecom", "wecom_webhook": "http://x"})
+    assert targets == [{"type": "wecom", "file_path": None, "webhook": "http://x",
+                        "name": "wecom-1", "format": "one_line", "timeout_sec": 10}]
+
+
+def test_publish_targets_isolated(tmp_path):
+    """测试并发投递、独立超时与失败隔离"""
+    server, base, received = _start_webhook_server()
+    outputs = [BulletinOutput(one_line="猪肉一句话", three_lines="猪肉\n三句话")]
+    targets = resolve_targets({"timeout_sec": 0.5, "targets": [
+        {"name": "文件", "type": "file", "format": "three_lines",
+         "file_path": str(tmp_path / "bulletin_{{date}}.txt")},
+        {"name": "主群", "type": "wecom", "webhook": f"{base}/ok"},
+        {"name": "慢群", "type": "wecom", "webhook": f"{base}/slow"},
+        {"name": "错群", "type": "wecom", "webhook": f"{base}/err", "timeout_sec": 3},
+        {"name": "未知", "type": "sms"},
+    ]})
+    try:
+        started = time.monotonic()
+        results = publish_targets(targets, outputs, "2025-08-21")
+        assert time.monotonic() - started < 1.5
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    status = {r.name: r.status for r in results}
+    assert status == {"文件": "ok", "主群": "ok", "慢群": "timeout", "错群": "failed", "未知": "failed"}
+    assert "猪肉\n三句话" in (tmp_path / "bulletin_2025-08-21.txt").read_text(encoding="utf-8")
+    assert ("/ok", "📊 市场价格快报\n• 猪肉一句话") in received
+    assert "invalid webhook url" in format_delivery_summary(results)
+
+
+def test_wecom_chunks_respect_byte_limit():
+    """测试企业微信消息按字节上限拆分"""
+    from publisher import _wecom_chunks
+    texts = [f"第{i}条：全国批发市场猪肉均价20.80元/公斤，较昨日下降0.7%。" for i in range(100)]
+    chunks = _wecom_chunks(texts, max_bytes=2048)
+    assert len(chunks) > 1
+    assert all(len(c.encode("utf-8")) <= 2048 for c in chunks)
+    assert sum(c.count("\n• ") for c in chunks) == 100
+
+
+def test_publish_targets_console_output_serialized(tmp_path, monkeypatch, capsys):
+    """测试投递线程不打印，终端内容由调用线程完整输出"""
+    import builtins
+    printed_from = []
+    real_print = builtins.print
+
+    def recording_print(*args, **kwargs):
+        printed_from.append(threading.current_thread().name)
+        real_print(*args, **kwargs)
+
+    monkeypatch.setattr(builtins, "print", recording_print)
+    outputs = [BulletinOutput(one_line=f"第{i}条一句话", three_lines=f"第{i}条\n三句话") for i in range(20)]
+    targets = resolve_targets({"targets": [
+        {"name": "终端1", "type": "stdout"},
+        {"name": "文件", "type": "file", "file_path": str(tmp_path / "b.txt")},
+        {"name": "终端2", "type": "stdout", "format": "three_lines"},
+    ]})
+    results = publish_targets(targets, outputs, "2025-08-21")
+
+    assert [r.status for r in results] == ["ok", "ok", "ok"]
+    assert set(printed_from) == {threading.main_thread().name}
+    out = capsys.readouterr().out
+    block1 = "\n".join(f"\n【{i}】 第{i - 1}条一句话" for i in range(1, 21))
+    assert block1 in out and out.index(block1) < out.index("第0条\n三句话")
+    assert "快报已保存到" not in out
+    assert f"已保存到 {tmp_path / 'b.txt'}" in format_delivery_summary(results)
+
+
+def test_hung_delivery_does_not_block_exit():
+    """测试超时后仍悬挂的投递不阻止进程退出（守护线程）"""
+    import subprocess
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (
+        "import time, publisher\n"
+        "from schemas import BulletinOutput\n"
+        "publisher._deliver = lambda *a: time.sleep(30)\n"
+        "targets = publisher.resolve_targets({'timeout_sec': 0.3, 'targets': [{'type': 'stdout'}]})\n"
+        "r = publisher.publish_targets(targets, [BulletinOutput(one_line='x', three_lines='x')], '2025-08-21')\n"
+        "assert r[0].status == 'timeout'\n"
+    )
+    started = time.monotonic()
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True, timeout=20)
+    assert time.monotonic() - started < 5
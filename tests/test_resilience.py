@@ -0,0 +1,217 @@
+"""
+取数韧性测试（本地桩服务注入延迟与故障）
+"""
+import sys
+import os
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import DataRecord
+from derive import derive_metrics
+from repo_adapter import fetch_price_from_api
+from resilience import Deadline, CircuitBreaker, GuardedFetcher
+
+
+class StubPriceServer:
+    """本地价格桩服务：按请求序号注入延迟/故障"""
+
+    def __init__(self, price: float = 85.2):
+        self.price = price
+        self.delays = {}        # 第 n 次请求 → 延迟秒数
+        self.fail = False       # 为 True 时一律返回 500
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delays.get(stub.hits, 0.0))
+                if stub.fail:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                body = json.dumps({"price": stub.price,
+                                   "commodity": parse_qs(urlparse(self.path).query)["commodity"][0]})
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body.encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _api_fetch(base_url):
+    def fetch(date_str, commodity, timeout=None):
+        return fetch_price_from_api(date_str, commodity, {"base_url": base_url},
+                                    timeout=timeout, raise_errors=True)
+    return fetch
+
+
+def test_hedged_request_beats_slow_primary():
+    """测试首个请求悬挂时由对冲请求返回"""
+    stub = StubPriceServer()
+    stub.delays = {1: 2.0}
+    fetcher = GuardedFetcher(Deadline(5.0), call_timeout_sec=3.0, hedge_after_sec=0.2)
+    try:
+        started = time.monotonic()
+        assert fetcher.call("api", _api_fetch(stub.base_url), "2025-08-21", "黑胡椒") == 85.2
+        assert time.monotonic() - started < 1.5
+        assert fetcher.stats["hedged"] == 1
+    finally:
+        fetcher.close()
+        stub.close()
+
+
+def test_breaker_trips_and_budget_degrades():
+    """测试连续失败后熔断，预算耗尽后返回None"""
+    stub = StubPriceServer()
+    stub.fail = True
+    fetcher = GuardedFetcher(Deadline(5.0), call_timeout_sec=1.0, hedge=False,
+                             breaker_failures=2, breaker_reset_sec=60)
+    fetch = _api_fetch(stub.base_url)
+    try:
+        for _ in range(4):
+            assert fetcher.call("api", fetch, "2025-08-21", "猪肉") is None
+        assert stub.hits == 2
+        assert fetcher.breaker("api").state == "open"
+        assert fetcher.stats["short_circuited"] == 2
+    finally:
+        fetcher.close()
+        stub.close()
+
+    stub = StubPriceServer()
+    stub.delays = {1: 1.0}
+    fetcher = GuardedFetcher(Deadline(0.3), call_timeout_sec=3.0, hedge=False)
+    try:
+        assert fetcher.call("api", _api_fetch(stub.base_url), "2025-08-21", "猪肉") is None
+        assert fetcher.call("api", _api_fetch(stub.base_url), "2025-08-21", "猪肉") is None
+        assert fetcher.stats["timeouts"] == 1
+        assert fetcher.stats["budget_exhausted"] == 1
+    finally:
+        fetcher.close()
+        stub.close()
+
+
+def test_degraded_ref_goes_missing():
+    """测试降级得到的None参考价走缺失处理"""
+    rec = DataRecord(commodity="猪肉", scope="全国批发市场", price_type="wholesale",
+                     unit="元/公斤", asof_date="2025-08-21", price_cur=20.80,
+                     refs={"D-1": 20.95, "W-1": None}, source_name="农业农村部监测")
+    met = derive_metrics(rec, {"flat_threshold_pct": 0.3})
+    assert met.missing_refs == ["W-1"]
+    assert "D-1" in met.delta_pct
+
+
+def test_breaker_isolated_per_source():
+    """测试一个数据源熔断不影响其他数据源的品类"""
+    import logging
+    from main import process_commodity
+
+    calls = []
+
+    def fetch_price(date_str, commodity, scope, price_type, unit, timeout=None):
+        calls.append(commodity)
+        if commodity.startswith("进口"):
+            raise ConnectionError("upstream down")
+        return 10.0
+
+    def fetch_ref_price(anchor_date, commodity, scope, price_type, unit, ref_code, timeout=None):
+        return fetch_price(anchor_date, commodity, scope, price_type, unit, timeout)
+
+    cfg = {"scope": "全国批发市场", "price_type": "wholesale", "unit": "元/公斤",
+           "references": ["D-1"], "fetch": {"sources": {"进口A": "customs", "进口B": "customs"}}}
+    sources = {"fetch_price": fetch_price, "fetch_ref_price": fetch_ref_price}
+    fetcher = GuardedFetcher(Deadline(5.0), hedge=False, breaker_failures=1)
+    logger = logging.getLogger("market_bulletin")
+    try:
+        for commodity in ("进口A", "进口B", "猪肉"):
+            rec = process_commodity(commodity, "2025-08-21", cfg, logger,
+                                    fetcher=fetcher, sources=sources)
+            assert (rec is None) == commodity.startswith("进口")
+        assert calls == ["进口A", "猪肉", "猪肉"]  # 进口B 被 customs 熔断跳过
+        assert fetcher.breaker("customs").state == "open"
+        assert fetcher.breaker("default").state == "closed"
+    finally:
+        fetcher.close()
+
+
+def test_circuit_breaker_half_open():
+    """测试熔断器半开试探"""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_sec=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 11.0
+    assert breaker.allow()
+    assert not breaker.allow()  # 半开只放行一个试探
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_fetch_all_concurrent_slow_source():
+    """测试品类并发取数：慢数据源不拖住健康数据源的品类"""
+    import logging
+    from main import fetch_all
+    from normalize import UnitNormalizer
+
+    def fetch_price(date_str, commodity, scope, price_type, unit, timeout=None):
+        if commodity.startswith("慢"):
+            time.sleep(timeout)
+            return None
+        time.sleep(0.1)
+        return 10.0
+
+    cfg = {"scope": "全国批发市场", "price_type": "wholesale", "unit": "元/公斤", "references": [],
+           "commodities": ["慢A", "慢B", "猪肉", "大米", "鸡蛋", "牛肉"],
+           "fetch": {"concurrency": 6, "sources": {"慢A": "slow", "慢B": "slow"}}}
+    fetcher = GuardedFetcher(Deadline(5.0), call_timeout_sec=0.8, hedge=False)
+    try:
+        started = time.monotonic()
+        quotes = fetch_all(cfg, "2025-08-21", logging.getLogger("market_bulletin"), fetcher,
+                           UnitNormalizer("元/公斤"), sources={"fetch_price": fetch_price})
+        elapsed = time.monotonic() - started
+    finally:
+        fetcher.close()
+
+    assert [q["commodity"] for q in quotes] == ["猪肉", "大米", "鸡蛋", "牛肉"]
+    assert elapsed < 1.5  # 顺序取数需 2×0.8 + 4×0.1 秒
+    assert fetcher.stats["timeouts"] == 2
+
+
+def test_hung_call_does_not_block_exit():
+    """测试悬挂的上游调用不阻止进程退出（守护线程）"""
+    import subprocess
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (
+        "import time\n"
+        "from resilience import Deadline, GuardedFetcher\n"
+        "f = GuardedFetcher(Deadline(5.0), call_timeout_sec=0.3, hedge=False)\n"
+        "assert f.call('hung', lambda timeout=None: time.sleep(30)) is None\n"
+        "f.close()\n"
+    )
+    started = time.monotonic()
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True, timeout=20)
+    assert time.monotonic() - started < 5
+
+
+if __name__ == "__main__":
+    test_hedged_request_beats_slow_primary()
+    test_breaker_trips_and_budget_degrades()
+    test_degraded_ref_goes_missing()
+    test_breaker_isolated_per_source()
+    test_circuit_breaker_half_open()
+    test_fetch_all_concurrent_slow_source()
+    test_hung_call_does_not_block_exit()
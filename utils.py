@@ -2,8 +2,14 @@
 工具模块 - 日期处理、格式化、日志等通用功能
 """
 import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional, Sequence
 
 
 def setup_logger(name: str = "market_bulletin", level: str = "INFO") -> logging.Logger:
@@ -22,6 +28,103 @@ def setup_logger(name: str = "market_bulletin", level: str = "INFO") -> logging.
     return logger
 
 
+class StageTimer:
+    """分阶段耗时记录（秒）"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.samples[name].append(time.perf_counter() - started)
+
+    def percentiles(self, pcts: Sequence[float] = (50, 95, 99)) -> Dict[str, Dict[str, float]]:
+        """各阶段的次数、合计与分位耗时"""
+        summary = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            stats = {"count": len(ordered), "total": sum(ordered)}
+            for p in pcts:
+                stats[f"p{p:g}"] = ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+            summary[name] = stats
+        return summary
+
+
+class DaemonPool:
+    """
+    守护线程池，接口同 ThreadPoolExecutor 的 submit / shutdown
+
+    ThreadPoolExecutor 的工作线程会在解释器退出时被 join，悬挂的上游调用会拖住进程；
+    这里的工作线程为守护线程，shutdown 后进程可直接退出，不等待悬挂中的调用。
+    """
+
+    def __init__(self, max_workers: int = 8, thread_name_prefix: str = "daemon"):
+        self._max_workers = max(1, max_workers)
+        self._prefix = thread_name_prefix
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._threads = []
+        self._idle = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        fut = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("线程池已关闭")
+            self._queue.put((fut, fn, args, kwargs))
+            if self._idle < self._queue.qsize() and len(self._threads) < self._max_workers:
+                t = threading.Thread(target=self._work, daemon=True,
+                                     name=f"{self._prefix}_{len(self._threads)}")
+                self._threads.append(t)
+                t.start()
+        return fut
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                self._idle += 1
+            item = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            if item is None:
+                return
+            fut, fn, args, kwargs = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+
+    def shutdown(self, wait: bool = False, cancel_futures: bool = True) -> None:
+        """关闭线程池；默认取消排队中的任务且不等待执行中的调用"""
+        with self._lock:
+            self._closed = True
+            threads = list(self._threads)
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for t in threads:
+                t.join()
+
+
 def parse_date(date_str: str) -> Optional[date]:
     """解析日期字符串"""
     if date_str == "auto":